@@ -0,0 +1 @@
+default_app_config = 'sideloader.web.apps.WebConfig'
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class WebConfig(AppConfig):
+    name = 'sideloader.web'
+    label = 'web'
+
+    def ready(self):
+        from sideloader.web import signals
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Build artifact cache
+#
+# Workers store prebuilt dependency layers (a virtualenv, say) under a
+# key derived from the repo's requirements files, its build_type and the
+# stream architecture. A later build with the same key fetches the layer
+# instead of installing everything again. Hits and misses are counted
+# per project in Redis.
+#
+# Workers use the cache directly, so SIDELOADER_ARTIFACT_ROOT must be on
+# a filesystem every build worker mounts (NFS, say) for builds on one
+# host to reuse layers made on another.
+
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import redis
+
+from django.conf import settings
+
+from sideloader.web.redisclient import getRedis
+
+
+STATS_KEY = 'sideloader.artifacts.%s'
+
+# Files in a checkout that decide what gets installed
+REQUIREMENTS = ('requirements*.txt', 'requirements*.pip', 'setup.py')
+
+def readRequirements(checkout):
+    """Requirement file names and contents from the top of a checkout"""
+    requirements = {}
+
+    for pattern in REQUIREMENTS:
+        for path in glob.glob(os.path.join(checkout, pattern)):
+            with open(path, 'rb') as f:
+                requirements[os.path.basename(path)] = f.read()
+
+    return requirements
+
+def cacheKey(requirements, build_type, architecture):
+    """requirements maps requirement file names to their contents"""
+    h = hashlib.sha256()
+
+    for name in sorted(requirements):
+        h.update('%s\0%s\0' % (name, requirements[name]))
+
+    h.update('%s\0%s' % (build_type, architecture))
+
+    return h.hexdigest()
+
+
+class LocalArtifactCache(object):
+    """Keeps artifacts as files under root. Reading an artifact touches
+    it, and the least recently used ones are removed once the cache is
+    bigger than max_bytes.
+
+    The size of the cache is tracked as artifacts are stored, and only
+    measured again by walking root when it goes over max_bytes or is more
+    than rescan seconds old, as other workers store artifacts too"""
+    def __init__(self, root, max_bytes, redis=None, rescan=600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.redis = redis
+        self.rescan = rescan
+        self.size = None
+        self.scanned = 0
+
+    def getRedis(self):
+        return self.redis or getRedis()
+
+    def record(self, project_id, **counts):
+        try:
+            pipe = self.getRedis().pipeline(transaction=False)
+            for field, amount in counts.items():
+                pipe.hincrby(STATS_KEY % project_id, field, amount)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def stats(self, project_id):
+        """Hit and miss counts of a project, None if Redis is unavailable"""
+        try:
+            counts = self.getRedis().hgetall(STATS_KEY % project_id)
+        except redis.RedisError:
+            return None
+
+        stats = dict((k, int(v)) for k, v in counts.items())
+
+        for field in ('hits', 'misses', 'stored', 'bytes_fetched'):
+            stats.setdefault(field, 0)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / float(lookups) if lookups else 0
+
+        return stats
+
+    def get(self, key, project_id):
+        """An open file with the artifact for key, or None"""
+        f = self.fetch(key)
+
+        if f is None:
+            self.record(project_id, misses=1)
+        else:
+            self.record(project_id, hits=1,
+                bytes_fetched=os.fstat(f.fileno()).st_size)
+
+        return f
+
+    def put(self, key, project_id, source):
+        """Stores the file at path source as the artifact for key"""
+        added = self.store(key, source)
+        self.record(project_id, stored=1)
+
+        if (self.size is None) or (time.time() - self.scanned > self.rescan):
+            self.evict()
+        else:
+            self.size += added
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def path(self, key):
+        if not key.isalnum():
+            raise ValueError('Bad artifact key %r' % key)
+
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key):
+        path = self.path(key)
+
+        try:
+            # The open file stays readable even if it is evicted now
+            f = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return f
+
+    def store(self, key, source):
+        """Returns by how many bytes the cache grew"""
+        path = self.path(key)
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another worker in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+
+        # Copy next to the final path and rename it into place, so
+        # readers never see a partial artifact
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            size = os.stat(tmp).st_size
+            os.rename(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+        return size - replaced
+
+    def entries(self):
+        entries = []
+        for directory, dirs, files in os.walk(self.root):
+            for name in files:
+                if name.startswith('.tmp'):
+                    continue
+
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append((st.st_mtime, st.st_size, path))
+
+        return entries
+
+    def evict(self):
+        """Measures the cache and removes the least recently used
+        artifacts until it fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+
+            total -= size
+
+        self.size = total
+        self.scanned = time.time()
+
+
+_cache = None
+
+def getArtifactCache():
+    global _cache
+
+    if _cache is None:
+        _cache = LocalArtifactCache(settings.SIDELOADER_ARTIFACT_ROOT,
+            settings.SIDELOADER_ARTIFACT_MAX_BYTES,
+            rescan=settings.SIDELOADER_ARTIFACT_RESCAN)
+
+    return _cache
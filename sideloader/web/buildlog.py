@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Build log storage
+#
+# Logs are stored as numbered BuildLogChunk rows of up to
+# SIDELOADER_LOG_CHUNK_SIZE characters, each compressed on its own.
+# Appending only ever rewrites the last, partly filled chunk, and range
+# reads only fetch the chunks they overlap.
+#
+# Builds from before the chunk store keep their log in Build.log. It is
+# moved into chunks the first time something is appended to the build,
+# or by the migrate_build_logs command.
+
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from sideloader.web import notify
+from sideloader.web.models import BuildLogChunk
+from sideloader.db import models
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'))
+
+def decompress(data):
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+def appendLog(build_id, text):
+    """Adds text to the end of a build's log, wakes up anything waiting
+    on the build and returns the new log size"""
+    size = settings.SIDELOADER_LOG_CHUNK_SIZE
+
+    with transaction.atomic():
+        # Locking the build row serialises writers of its log
+        build = models.Build.objects.select_for_update().only(
+            'id', 'state').get(id=build_id)
+
+        last = BuildLogChunk.objects.filter(
+            build_id=build_id).order_by('-seq').first()
+
+        if last is None:
+            builds = models.Build.objects.filter(id=build_id)
+            legacy = builds.values_list('log', flat=True)[0]
+            if legacy:
+                text = legacy + text
+                builds.update(log='')
+
+            seq, offset = 0, 0
+        else:
+            if (last.length < size) and text:
+                room = size - last.length
+                last.data = compress(decompress(last.data) + text[:room])
+                last.length += len(text[:room])
+                last.save(update_fields=['data', 'length'])
+                text = text[room:]
+
+            seq, offset = last.seq + 1, last.offset + last.length
+
+        chunks = []
+        for i in range(0, len(text), size):
+            piece = text[i:i + size]
+            chunks.append(BuildLogChunk(build_id=build_id, seq=seq,
+                offset=offset, length=len(piece), data=compress(piece)))
+            seq += 1
+            offset += len(piece)
+
+        BuildLogChunk.objects.bulk_create(chunks)
+
+    notify.notifyBuild(build)
+
+    return offset
+
+def logSize(build_id):
+    """Length of the stored log, or None if the build has no chunks"""
+    last = BuildLogChunk.objects.filter(build_id=build_id).order_by(
+        '-seq').values_list('offset', 'length').first()
+
+    return sum(last) if last else None
+
+def readLog(build_id, offset=0):
+    """The log from character offset to the end"""
+    chunks = BuildLogChunk.objects.filter(build_id=build_id,
+        offset__gt=offset - F('length')).order_by('seq')
+
+    return u''.join(decompress(data)[max(offset - start, 0):]
+        for start, data in chunks.values_list('offset', 'data'))
+
+def tailLog(build_id, chars):
+    """The last chars characters of the log and the offset they start at"""
+    start = max((logSize(build_id) or 0) - chars, 0)
+
+    return readLog(build_id, start), start
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# Build admission
+#
+# Deciding whether to start a build is serialised per project and branch,
+# or per repo for builds of a single repo, with a Postgres advisory lock,
+# so concurrent webhooks can't each see no running build and start one.
+# Pushes that arrive while a build is running add their branch to a
+# follow-up set, and each branch in it is built once more when that
+# build finishes. Pushes that find a build of the same branch still
+# waiting in the queue need nothing, it will check out the latest code
+# when it starts. A repo's branches are built one after the other.
+#
+# Admitted builds wait in a queue in Redis and are handed to Rhumba by
+# dispatch(), which enforces a global and a per-project limit on running
+# builds. Release branches go first, then the project with the fewest
+# running builds, then the oldest request.
+
+import calendar
+import fnmatch
+import json
+import time
+import zlib
+
+import redis
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from sideloader.web import tasks, notify, heartbeats
+from sideloader.web.redisclient import getRedis
+from sideloader.db import models
+
+
+# First key of the two-key advisory lock, to keep clear of other users
+LOCK_NAMESPACE = 0x51de
+
+def lockBuildSlot(project_id, branch):
+    """Holds the build slot for project and branch until the end of the
+    current transaction"""
+    if connection.vendor == 'postgresql':
+        key = zlib.crc32('%s:%s' % (project_id, branch))
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)',
+            [LOCK_NAMESPACE, key])
+
+def followUpKey(project_id, scope):
+    return 'sideloader.build.followups.%s.%s' % (project_id, scope)
+
+def requestFollowUp(project_id, scope, branch):
+    try:
+        getRedis().sadd(followUpKey(project_id, scope), branch)
+    except redis.RedisError:
+        # Better to miss the follow-up than to fail the push
+        pass
+
+def queuedBranch(build_id):
+    """The branch a queued build will check out, or None"""
+    try:
+        entry = getRedis().hget(QUEUE_KEY, build_id)
+    except redis.RedisError:
+        return None
+
+    return json.loads(entry)['branch'] if entry else None
+
+def buildScope(branch, repo_id=None):
+    """Builds of one of a project's repos only wait for builds of that
+    repo, other builds for the project's builds of the branch"""
+    return 'repo%s' % repo_id if repo_id else branch
+
+def seenDelivery(delivery):
+    """Records a webhook delivery id, returns True if it was seen before"""
+    try:
+        return not getRedis().set('sideloader.delivery.%s' % delivery, 1,
+            nx=True, ex=settings.SIDELOADER_DELIVERY_TTL)
+    except redis.RedisError:
+        # The build slot lock still stops duplicate builds
+        return False
+
+def admitBuild(project, branch=None, delivery=None, followup=True, **fields):
+    """Starts a build of project unless one is already running.
+
+    Returns a (result, build) tuple where result is 'duplicate' if this
+    webhook delivery was already handled, 'queued' with the waiting
+    build if one hasn't been dispatched yet, 'running' with the current
+    build if one is in progress, or 'building' with the new build. When
+    followup is set the branch is built again once the current build is
+    done, however many pushes came in meanwhile."""
+    branch = branch or project.branch
+    repo_id = fields.get('repo_id')
+    scope = buildScope(branch, repo_id)
+
+    if delivery and seenDelivery(delivery):
+        return 'duplicate', None
+
+    with transaction.atomic():
+        lockBuildSlot(project.id, scope)
+
+        current = models.Build.objects.filter(project=project, state=0)
+        # Builds of a single repo and project-wide builds are separate,
+        # like their follow-ups
+        if repo_id:
+            current = current.filter(repo_id=repo_id)
+        else:
+            current = current.filter(repo_id__isnull=True)
+        current = current.order_by('-build_time').first()
+
+        if current and not current.task_id:
+            # The waiting build of a repo may be for another branch
+            if followup and repo_id and (
+                    queuedBranch(current.id) not in (None, branch)):
+                requestFollowUp(project.id, scope, branch)
+            return 'queued', current
+
+        if current:
+            if followup:
+                requestFollowUp(project.id, scope, branch)
+            return 'running', current
+
+        build = models.Build.objects.create(project=project, state=0,
+            **fields)
+
+    # Queue outside the transaction so the worker can see the build
+    enqueue(build, branch)
+
+    return 'building', build
+
+def buildFinished(build):
+    """Starts a follow-up build of each branch pushed to while this build
+    was running"""
+    project = build.project
+    key = followUpKey(project.id,
+        buildScope(project.branch, build.repo_id))
+
+    try:
+        pipe = getRedis().pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        branches = pipe.execute()[0]
+    except redis.RedisError:
+        branches = set()
+
+    if build.repo_id:
+        for branch in sorted(branches):
+            admitBuild(project, branch=branch, repo_id=build.repo_id)
+    elif branches:
+        admitBuild(project)
+
+    dispatch()
+
+
+QUEUE_KEY = 'sideloader.buildqueue'
+LOCK_KEY = 'sideloader.buildqueue.lock'
+REQUESTED_KEY = 'sideloader.buildqueue.requested'
+
+def branchPriority(branch):
+    """0 for release branches, 1 for everything else"""
+    for pattern in settings.SIDELOADER_RELEASE_BRANCHES:
+        if fnmatch.fnmatch(branch or '', pattern):
+            return 0
+    return 1
+
+def startBuild(build, branch=None):
+    try:
+        build.task_id = tasks.build(build, branch)
+    except Exception:
+        build.state = 2
+        build.save()
+        raise
+
+    # Only the task id, the reaper may have failed the build meanwhile
+    if not models.Build.objects.filter(id=build.id, state=0).update(
+            task_id=build.task_id):
+        return
+
+    notify.notifyBuild(build)
+
+    # Dispatch is the first beat, so a worker that never beats times out
+    try:
+        heartbeats.beat(build.task_id)
+    except redis.RedisError:
+        pass
+
+def enqueue(build, branch):
+    entry = json.dumps({
+        'project': build.project_id,
+        'branch': branch,
+        'priority': branchPriority(branch),
+        'queued': time.time()
+    })
+
+    try:
+        getRedis().hset(QUEUE_KEY, build.id, entry)
+    except redis.RedisError:
+        # Without the queue we can still build, just without limits
+        startBuild(build, branch)
+        return
+
+    dispatch()
+
+def getQueue():
+    """Queued entries as dicts with a 'build' id"""
+    entries = []
+    for build_id, entry in getRedis().hgetall(QUEUE_KEY).items():
+        entry = json.loads(entry)
+        entry['build'] = int(build_id)
+        entries.append(entry)
+
+    return entries
+
+def runningBuilds():
+    """In progress builds that have been handed to Rhumba"""
+    return models.Build.objects.filter(state=0).exclude(
+        Q(task_id__isnull=True) | Q(task_id=''))
+
+def dispatchOrder(entry, running):
+    return (entry['priority'], running.get(entry['project'], 0),
+        entry['queued'])
+
+def dispatch():
+    """Starts as many queued builds as the concurrency limits allow. This
+    never waits for another dispatch, it asks that one to go round again"""
+    r = getRedis()
+
+    try:
+        r.set(REQUESTED_KEY, 1)
+
+        while True:
+            lock = r.lock(LOCK_KEY, timeout=60)
+            if not lock.acquire(blocking=False):
+                # The holder checks for requests before it lets go
+                return
+
+            try:
+                while r.delete(REQUESTED_KEY):
+                    dispatchQueue(r)
+            finally:
+                lock.release()
+
+            # A request made after the last check found the lock still held
+            if not r.exists(REQUESTED_KEY):
+                return
+    except redis.RedisError:
+        # Whatever is still queued goes out on the next dispatch
+        pass
+
+def dispatchQueue(r):
+    entries = getQueue()
+    if not entries:
+        return
+
+    builds = models.Build.objects.select_related('project').in_bulk(
+        [e['build'] for e in entries])
+
+    # Drop builds that were cancelled or removed while queued
+    for entry in list(entries):
+        build = builds.get(entry['build'])
+        if (build is None) or (build.state != 0) or build.task_id:
+            r.hdel(QUEUE_KEY, entry['build'])
+            entries.remove(entry)
+
+    running = dict(runningBuilds().values_list('project').annotate(
+        Count('id')))
+    total = sum(running.values())
+
+    while entries and total < settings.SIDELOADER_MAX_BUILDS:
+        candidates = [e for e in entries if running.get(e['project'], 0)
+            < settings.SIDELOADER_MAX_PROJECT_BUILDS]
+
+        if not candidates:
+            break
+
+        entry = min(candidates, key=lambda e: dispatchOrder(e, running))
+        entries.remove(entry)
+        r.hdel(QUEUE_KEY, entry['build'])
+
+        try:
+            startBuild(builds[entry['build']], entry['branch'])
+        except Exception:
+            # startBuild marked it failed, carry on with the rest
+            continue
+
+        running[entry['project']] = running.get(entry['project'], 0) + 1
+        total += 1
+
+def queueStatus(now=None):
+    """Queued builds in the order they are expected to start, with an
+    estimated start time assuming every build takes
+    SIDELOADER_BUILD_ESTIMATE seconds"""
+    now = now or time.time()
+    estimate = settings.SIDELOADER_BUILD_ESTIMATE
+
+    slots = []
+    for build in runningBuilds().only('project', 'build_time'):
+        started = calendar.timegm(build.build_time.utctimetuple())
+        slots.append((max(started + estimate, now), build.project_id))
+
+    pending = getQueue()
+    status = []
+    t = now
+
+    while pending:
+        active = [s for s in slots if s[0] > t]
+        running = {}
+        for finish, project in active:
+            running[project] = running.get(project, 0) + 1
+
+        candidates = [e for e in pending if running.get(e['project'], 0)
+            < settings.SIDELOADER_MAX_PROJECT_BUILDS]
+
+        if candidates and len(active) < settings.SIDELOADER_MAX_BUILDS:
+            entry = min(candidates, key=lambda e: dispatchOrder(e, running))
+            pending.remove(entry)
+
+            entry['eta'] = t
+            status.append(entry)
+            slots.append((t + estimate, entry['project']))
+        elif active:
+            t = min(s[0] for s in active)
+        else:
+            break
+
+    return status
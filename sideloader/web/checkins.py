@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Server check-ins
+#
+# Check-ins are buffered in a Redis hash of hostname to time and written
+# out together every SIDELOADER_CHECKIN_FLUSH seconds by whichever
+# request takes the flush lock, or by the checkin_flusher command when
+# no check-ins arrive. A flush is one UPDATE for the servers we know and
+# one INSERT for new hostnames, instead of a full row save per check-in.
+
+import time
+import uuid
+from datetime import datetime
+
+import redis
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+
+from sideloader.web.redisclient import getRedis
+from sideloader.db import models
+
+
+BUFFER_KEY = 'sideloader.checkins'
+FLUSH_LOCK_KEY = 'sideloader.checkins.flush'
+
+# Servers per UPDATE statement
+CHUNK_SIZE = 500
+
+def recordCheckins(hostnames, now=None):
+    now = now or time.time()
+    checkins = dict((name, now) for name in hostnames)
+
+    if not checkins:
+        return
+
+    try:
+        getRedis().hmset(BUFFER_KEY, checkins)
+    except redis.RedisError:
+        writeCheckins(checkins)
+        return
+
+    flushDue()
+
+def flushDue():
+    """Flushes the buffer unless that was done in the last
+    SIDELOADER_CHECKIN_FLUSH seconds"""
+    try:
+        due = getRedis().set(FLUSH_LOCK_KEY, 1, nx=True,
+            ex=settings.SIDELOADER_CHECKIN_FLUSH)
+    except redis.RedisError:
+        return 0
+
+    return flushCheckins() if due else 0
+
+def flushCheckins():
+    """Writes out everything in the buffer, returns the number of servers"""
+    r = getRedis()
+
+    # Move the buffer aside so check-ins during the flush start a new one
+    flushing = '%s.%s' % (BUFFER_KEY, uuid.uuid4().hex)
+    try:
+        r.rename(BUFFER_KEY, flushing)
+    except redis.ResponseError:
+        # Nothing buffered
+        return 0
+
+    checkins = r.hgetall(flushing)
+
+    try:
+        writeCheckins(checkins)
+    except Exception:
+        restoreCheckins(flushing, checkins)
+        raise
+
+    r.delete(flushing)
+
+    return len(checkins)
+
+def restoreCheckins(flushing, checkins):
+    """Puts check-ins that could not be written back in the buffer,
+    unless the host has checked in again since"""
+    pipe = getRedis().pipeline()
+    for name, t in checkins.items():
+        pipe.hsetnx(BUFFER_KEY, name, t)
+    pipe.delete(flushing)
+    pipe.execute()
+
+def writeCheckins(checkins):
+    times = dict((name, datetime.fromtimestamp(float(t), timezone.utc))
+        for name, t in checkins.items())
+
+    names = times.keys()
+    existing = set()
+
+    for i in range(0, len(names), CHUNK_SIZE):
+        chunk = names[i:i + CHUNK_SIZE]
+        existing.update(models.Server.objects.filter(
+            name__in=chunk).values_list('name', flat=True))
+
+    new = [name for name in names if name not in existing]
+    if new:
+        try:
+            with transaction.atomic():
+                models.Server.objects.bulk_create([
+                    models.Server(name=name, last_checkin=times[name])
+                    for name in new])
+        except IntegrityError:
+            # Another flush added some of these, fall back to one by one
+            for name in new:
+                server, created = models.Server.objects.get_or_create(
+                    name=name, defaults={'last_checkin': times[name]})
+                if not created:
+                    existing.add(name)
+
+    existing = list(existing)
+    for i in range(0, len(existing), CHUNK_SIZE):
+        chunk = existing[i:i + CHUNK_SIZE]
+        models.Server.objects.filter(name__in=chunk).update(
+            last_checkin=Case(
+                *[When(name=name, then=Value(times[name])) for name in chunk],
+                output_field=DateTimeField()
+            )
+        )
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Rhumba cluster status
+#
+# Asking Rhumba for the cluster status is too slow to do while rendering
+# a page. The status is kept in the cache and pages get whatever is
+# there. Once it is older than SIDELOADER_CLUSTER_TTL one process
+# refreshes it from a background thread, and until then readers keep
+# getting the old copy.
+#
+# Rhumba can't say which builds a hive is running, so running builds
+# come from the database and held builds from the build queue.
+
+import calendar
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from sideloader.web import buildqueue, tasks
+from sideloader.web.redisclient import getRedis
+
+
+CACHE_KEY = 'sideloader.cluster'
+REFRESH_KEY = 'sideloader.cluster.refresh'
+
+def collectStatus(now=None):
+    """Hives as Rhumba reports them, and running and held builds"""
+    now = now or time.time()
+
+    hives = []
+    for name, hive in sorted(tasks.getClusterStatus().items()):
+        hives.append({
+            'hostname': name,
+            'lastseen': hive['lastseen'],
+            'lastseen_text': time.ctime(hive['lastseen']),
+            'status': hive['status']
+        })
+
+    builds = []
+    for build in buildqueue.runningBuilds().select_related('project').only(
+            'id', 'build_time', 'project__name').order_by('build_time'):
+        builds.append({
+            'id': build.id,
+            'project': build.project.name,
+            'started': calendar.timegm(build.build_time.utctimetuple())
+        })
+
+    return {
+        'fetched': now,
+        'hives': hives,
+        'builds': builds,
+        'queue': {
+            'running': len(builds),
+            # Admitted but held back by the build concurrency limits
+            'held': getRedis().hlen(buildqueue.QUEUE_KEY)
+        }
+    }
+
+def refresh():
+    try:
+        cache.set(CACHE_KEY, collectStatus(), None)
+    except redis.RedisError:
+        pass
+    finally:
+        cache.delete(REFRESH_KEY)
+        connection.close()
+
+def startRefresh():
+    # Only one process refreshes at a time, the key expires in case it dies
+    if cache.add(REFRESH_KEY, 1, 60):
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+def getStatus():
+    """The cached cluster status. Never blocks on Rhumba, and returns
+    None if nothing has been collected yet"""
+    status = cache.get(CACHE_KEY)
+
+    if (status is None) or (
+            time.time() - status['fetched'] > settings.SIDELOADER_CLUSTER_TTL):
+        startRefresh()
+
+    return status
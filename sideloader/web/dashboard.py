@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Dashboard cache keys
+#
+# Rendered dashboard panels are cached under a generation that is
+# replaced whenever a build starts or changes state, so one write drops
+# every cached copy.
+
+import uuid
+
+from django.core.cache import cache
+
+
+GENERATION_KEY = 'sideloader.dashboard.gen'
+
+def invalidateDashboard():
+    """Called whenever a build starts or changes state"""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+def getGeneration():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(GENERATION_KEY, generation, None):
+            generation = cache.get(GENERATION_KEY, generation)
+
+    return generation
+
+def dashboardKey(scope):
+    return 'sideloader.dashboard.%s.%s' % (getGeneration(), scope)
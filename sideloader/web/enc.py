@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Compiled Puppet ENC documents
+#
+# Nodes are compiled once and kept in the cache as pre-serialised YAML
+# until something that feeds into them changes. Each server has a
+# generation token which is replaced on invalidation, so a compile that
+# races with a change can never be served afterwards.
+
+import hashlib
+import json
+import uuid
+
+import yaml
+
+from django.conf import settings
+from django.core.cache import cache
+
+from sideloader.db import models
+
+
+def generationKey(name):
+    return 'sideloader.enc.gen.%s' % name
+
+def nodeKey(name, generation):
+    return 'sideloader.enc.node.%s.%s' % (name, generation)
+
+def getGeneration(name):
+    generation = cache.get(generationKey(name))
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(generationKey(name), generation, None):
+            generation = cache.get(generationKey(name), generation)
+
+    return generation
+
+def compileNode(server):
+    """Merge the manifests of every release targeting server. Returns the
+    ENC node and the status string for the server"""
+    status = "Success"
+
+    releases = [target.release for target in
+        server.target_set.select_related('release__project')]
+
+    manifests = {}
+    for manifest in models.ServerManifest.objects.filter(
+            release__in=[r.id for r in releases]).select_related('module'):
+        manifests.setdefault(manifest.release_id, []).append(manifest)
+
+    cdict = {}
+    for release in releases:
+        for manifest in manifests.get(release.id, []):
+            key = manifest.module.key
+            try:
+                value = json.loads(manifest.value)
+            except Exception, e:
+                status = "Validation error in manifest "
+                status += "%s -> %s -> %s: %s" % (
+                    release.project.name,
+                    release.name,
+                    manifest.module.name,
+                    e
+                )
+                continue
+
+            if isinstance(value, list):
+                if key in cdict:
+                    cdict[key].extend(value)
+                else:
+                    cdict[key] = value
+
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    if key in cdict:
+                        cdict[key][k] = v
+                    else:
+                        cdict[key] = {k: v}
+
+    return {'parameters': cdict}, status
+
+def getNode(name):
+    """Returns a dict with the node 'yaml', its 'etag' and the server
+    'status', or None if the server is unknown"""
+    generation = getGeneration(name)
+    node = cache.get(nodeKey(name, generation))
+
+    if node is None:
+        try:
+            server = models.Server.objects.get(name=name)
+        except models.Server.DoesNotExist:
+            return None
+
+        cdict, status = compileNode(server)
+        body = yaml.safe_dump(cdict)
+
+        node = {
+            'yaml': body,
+            'etag': '"%s"' % hashlib.sha1(body).hexdigest(),
+            'status': status
+        }
+
+        cache.set(nodeKey(name, generation), node,
+            settings.SIDELOADER_ENC_CACHE_TTL)
+
+    return node
+
+def invalidate(names):
+    for name in names:
+        cache.set(generationKey(name), uuid.uuid4().hex, None)
+
+def invalidateServer(server_id):
+    invalidate(models.Server.objects.filter(
+        id=server_id).values_list('name', flat=True))
+
+def invalidateRelease(release_id):
+    invalidate(models.Server.objects.filter(
+        target__release=release_id).values_list('name', flat=True))
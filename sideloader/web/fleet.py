@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Fleet liveness
+#
+# Everything here is a fixed number of aggregate queries, with stale
+# servers found through the index on Server.last_checkin.
+
+from datetime import timedelta
+
+from django.db.models import Case, When, Q, Count, IntegerField
+from django.utils import timezone
+
+from sideloader.db import models
+
+
+def staleQ(cutoff, prefix=''):
+    return (Q(**{prefix + 'last_checkin__lt': cutoff}) |
+        Q(**{prefix + 'last_checkin__isnull': True}))
+
+def countStale(cutoff, prefix='', field='id'):
+    return Count(Case(When(staleQ(cutoff, prefix), then=field),
+        output_field=IntegerField()), distinct=True)
+
+def fleetStatus(max_age, project_ids=None, limit=100):
+    """Stale and healthy server counts overall, per project and per
+    target, and the stalest servers. max_age is in seconds, project_ids
+    limits the result to those projects"""
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+
+    servers = models.Server.objects.all()
+    targets = models.Target.objects.filter(server__isnull=False)
+
+    if project_ids is not None:
+        servers = servers.filter(target__project__in=project_ids)
+        targets = targets.filter(project__in=project_ids)
+
+    totals = servers.aggregate(
+        total=Count('id', distinct=True),
+        stale=countStale(cutoff)
+    )
+
+    projects = targets.values('project', 'project__name').annotate(
+        total=Count('server', distinct=True),
+        stale=countStale(cutoff, 'server__', 'server')
+    ).order_by('project__name')
+
+    per_target = targets.values(
+        'id', 'description', 'project', 'project__name'
+    ).annotate(
+        total=Count('server', distinct=True),
+        stale=countStale(cutoff, 'server__', 'server')
+    ).order_by('project__name', 'description')
+
+    # Servers that never checked in are the stalest. They are fetched
+    # first, so the rest is a range scan of the last_checkin index
+    fields = ('name', 'last_checkin', 'last_puppet_run', 'status', 'change')
+
+    stale = list(servers.filter(last_checkin__isnull=True).distinct(
+        ).order_by('name').values(*fields)[:limit])
+
+    if len(stale) < limit:
+        stale.extend(servers.filter(last_checkin__lt=cutoff).distinct(
+            ).order_by('last_checkin').values(*fields)[:limit - len(stale)])
+
+    def healthy(row):
+        row['healthy'] = row['total'] - row['stale']
+        return row
+
+    return {
+        'max_age': max_age,
+        'total': totals['total'],
+        'stale': totals['stale'],
+        'healthy': totals['total'] - totals['stale'],
+        'projects': [healthy(row) for row in projects],
+        'targets': [healthy(row) for row in per_target],
+        'stale_servers': stale,
+    }
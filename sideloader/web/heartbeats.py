@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+# Build heartbeats
+#
+# The time of a running build's last heartbeat is kept in a Redis sorted
+# set keyed on its Rhumba task id. Dispatching a build counts as its first
+# beat, after that workers beat through the heartbeat API.
+
+import time
+
+from sideloader.web.redisclient import getRedis
+
+
+HEARTBEAT_KEY = 'sideloader.build.heartbeats'
+
+def beat(task_id, now=None):
+    """Record that the build running as task_id is still alive"""
+    getRedis().zadd(HEARTBEAT_KEY, now or time.time(), task_id)
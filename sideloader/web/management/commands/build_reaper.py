@@ -0,0 +1,34 @@
+import time
+
+import redis
+
+from django.core.management.base import BaseCommand
+
+from sideloader.web import buildqueue, reaper
+
+
+class Command(BaseCommand):
+    help = ('Fails running builds whose worker has stopped sending '
+        'heartbeats and starts queued builds as slots free up')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=30,
+            help='Seconds between checks for stuck and queued builds')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                reaped = reaper.reap()
+            except redis.RedisError as e:
+                self.stderr.write('Could not read heartbeats: %s' % e)
+                reaped = []
+
+            for build in reaped:
+                self.stdout.write('Build %s of %s timed out' % (
+                    build.id, build.project.name))
+
+            # Builds finished by workers don't pass through this process's
+            # signals, so held builds are also dispatched from here
+            buildqueue.dispatch()
+
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from sideloader.web import checkins
+
+
+class Command(BaseCommand):
+    help = ('Writes out buffered server check-ins, which are otherwise only '
+        'written when a check-in arrives')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int,
+            default=settings.SIDELOADER_CHECKIN_FLUSH,
+            help='Seconds between checks of the check-in buffer')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                checkins.flushDue()
+            except (redis.RedisError, DatabaseError) as e:
+                self.stderr.write('Could not flush check-ins: %s' % e)
+
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from sideloader.web import buildlog
+from sideloader.web.models import BuildLogChunk
+from sideloader.db import models
+
+
+class Command(BaseCommand):
+    help = 'Moves finished build logs from Build.log into the chunk store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100,
+            help='Builds to look at per query')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        moved = 0
+
+        while True:
+            # Running builds are left to their workers
+            ids = list(models.Build.objects.filter(id__gt=last_id).exclude(
+                state=0).exclude(log__isnull=True).exclude(log='').order_by(
+                'id').values_list('id', flat=True)[:options['batch']])
+
+            if not ids:
+                break
+
+            last_id = ids[-1]
+
+            chunked = set(BuildLogChunk.objects.filter(build_id__in=ids
+                ).values_list('build_id', flat=True))
+
+            for build_id in ids:
+                if build_id not in chunked:
+                    buildlog.appendLog(build_id, '')
+                    moved += 1
+
+            self.stdout.write('Moved %s logs, up to build %s' % (
+                moved, last_id))
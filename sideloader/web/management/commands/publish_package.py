@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sideloader.db import models
+from sideloader.web import repoindex
+
+
+class Command(BaseCommand):
+    help = ('Publishes a package file into a package repo and updates the '
+        "repo's indexes with it. Used by releases to 'repo' mode targets")
+
+    def add_arguments(self, parser):
+        parser.add_argument('repo', help='Name of the package repo')
+        parser.add_argument('package', help='Path of the package file')
+        parser.add_argument('--type', default=None, choices=('deb', 'rpm'),
+            help='Package type, by default taken from the file extension')
+
+    def handle(self, *args, **options):
+        if not models.PackageRepo.objects.filter(
+                name=options['repo']).exists():
+            raise CommandError('No package repo %s' % options['repo'])
+
+        package_type = options['type'] or (
+            'rpm' if options['package'].endswith('.rpm') else 'deb')
+
+        digest = repoindex.publishToRepo(options['repo'], options['package'],
+            package_type)
+
+        self.stdout.write(digest)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sideloader.web.releasequeue import ReleaseScheduler
+
+
+class Command(BaseCommand):
+    help = 'Fires scheduled releases when they are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=5,
+            help='Seconds between checks for due releases')
+
+    def handle(self, *args, **options):
+        ReleaseScheduler(
+            max_lateness=settings.SIDELOADER_SCHEDULE_MAX_LATENESS
+        ).run(options['interval'])
@@ -0,0 +1,27 @@
+import time
+
+import redis
+
+from django.core.management.base import BaseCommand
+
+from sideloader.web import repoindex
+
+
+class Command(BaseCommand):
+    help = 'Runs queued rebuilds of package repo indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=5,
+            help='Seconds between checks for queued rebuilds')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                for repo_name in repoindex.rebuildQueued():
+                    self.stdout.write('Rebuilt indexes of %s' % repo_name)
+            except redis.RedisError as e:
+                self.stderr.write('Could not read queued rebuilds: %s' % e)
+            except Exception as e:
+                self.stderr.write('Rebuild failed: %s' % e)
+
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sideloader.web.rollout import RolloutRunner
+
+
+class Command(BaseCommand):
+    help = 'Runs queued server rollouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=5,
+            help='Seconds to wait for a rollout before checking for '
+                'rollouts whose runner has died')
+
+    def handle(self, *args, **options):
+        RolloutRunner(
+            lease=settings.SIDELOADER_ROLLOUT_LEASE
+        ).run(options['interval'])
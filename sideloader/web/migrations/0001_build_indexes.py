@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps import apps as global_apps
+from django.db import migrations
+
+
+# Composite indexes for keyset pagination of build history, newest first
+INDEXES = (
+    ('web_build_time_idx', ()),
+    ('web_build_project_time_idx', ('project',)),
+    ('web_build_repo_time_idx', ('repo',)),
+    ('web_build_state_time_idx', ('state',)),
+)
+
+def createIndexes(apps, schema_editor):
+    # Table and column names come from the real model, historical models
+    # of an unmigrated app don't carry their relations
+    Build = global_apps.get_model('db', 'Build')
+    quote = schema_editor.quote_name
+
+    for name, fields in INDEXES:
+        columns = [quote(Build._meta.get_field(f).column) for f in fields]
+        columns.extend([
+            '%s DESC' % quote(Build._meta.get_field('build_time').column),
+            '%s DESC' % quote(Build._meta.pk.column)
+        ])
+
+        schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (
+            quote(name), quote(Build._meta.db_table), ', '.join(columns)))
+
+def dropIndexes(apps, schema_editor):
+    for name, fields in INDEXES:
+        schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__latest__'),
+    ]
+
+    operations = [
+        migrations.RunPython(createIndexes, dropIndexes),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__latest__'),
+        ('web', '0001_build_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledRelease',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('due_at', models.DateTimeField()),
+                ('fired_at', models.DateTimeField(null=True, blank=True)),
+                ('state', models.IntegerField(default=0)),
+                ('build', models.ForeignKey(to='db.Build')),
+                ('flow', models.ForeignKey(to='db.ReleaseStream')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='scheduledrelease',
+            index_together=set([('state', 'due_at')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps import apps as global_apps
+from django.db import migrations
+
+
+# Lets the fleet view find servers that have stopped checking in with an
+# index range scan
+INDEX = 'web_server_last_checkin_idx'
+
+def createIndex(apps, schema_editor):
+    # Table and column names come from the real model, historical models
+    # of an unmigrated app don't carry their relations
+    Server = global_apps.get_model('db', 'Server')
+    quote = schema_editor.quote_name
+
+    schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (
+        quote(INDEX),
+        quote(Server._meta.db_table),
+        quote(Server._meta.get_field('last_checkin').column)
+    ))
+
+def dropIndex(apps, schema_editor):
+    schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__latest__'),
+        ('web', '0002_scheduledrelease'),
+    ]
+
+    operations = [
+        migrations.RunPython(createIndex, dropIndex),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps import apps as global_apps
+from django.db import migrations
+
+
+# Partial index over in-progress builds only, so the build reaper and the
+# build queue don't scan the whole build history
+INDEX = 'web_build_running_idx'
+
+def createIndex(apps, schema_editor):
+    # Table and column names come from the real model, historical models
+    # of an unmigrated app don't carry their relations
+    Build = global_apps.get_model('db', 'Build')
+    quote = schema_editor.quote_name
+
+    schema_editor.execute('CREATE INDEX %s ON %s (%s) WHERE %s = 0' % (
+        quote(INDEX),
+        quote(Build._meta.db_table),
+        quote(Build._meta.get_field('project').column),
+        quote(Build._meta.get_field('state').column)
+    ))
+
+def dropIndex(apps, schema_editor):
+    schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__latest__'),
+        ('web', '0003_server_checkin_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(createIndex, dropIndex),
+    ]
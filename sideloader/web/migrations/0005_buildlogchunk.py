@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__latest__'),
+        ('web', '0004_build_running_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildLogChunk',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('seq', models.IntegerField()),
+                ('offset', models.IntegerField()),
+                ('length', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('build', models.ForeignKey(to='db.Build')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='buildlogchunk',
+            unique_together=set([('build', 'seq')]),
+        ),
+    ]
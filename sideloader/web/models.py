@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class ScheduledRelease(models.Model):
+    PENDING = 0
+    FIRED = 1
+    MISSED = 2
+    FAILED = 3
+
+    build = models.ForeignKey('db.Build')
+    flow = models.ForeignKey('db.ReleaseStream')
+    due_at = models.DateTimeField()
+    fired_at = models.DateTimeField(null=True, blank=True)
+    state = models.IntegerField(default=PENDING)
+
+    class Meta:
+        index_together = (('state', 'due_at'),)
+
+class BuildLogChunk(models.Model):
+    """A piece of a build log, zlib compressed. offset and length count
+    characters of the uncompressed log"""
+    build = models.ForeignKey('db.Build')
+    seq = models.IntegerField()
+    offset = models.IntegerField()
+    length = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = (('build', 'seq'),)
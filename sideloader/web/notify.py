@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Change notifications for long-polling views
+
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+
+
+class LocalSubscription(object):
+    def __init__(self, notifier, channel):
+        self.notifier = notifier
+        self.channel = channel
+
+        with notifier.cond:
+            self.seen = notifier.counters.get(channel, 0)
+
+    def wait(self, timeout):
+        """Block until the channel is published to or timeout seconds pass.
+        Returns True if a notification arrived"""
+        deadline = time.time() + timeout
+
+        with self.notifier.cond:
+            while self.notifier.counters.get(self.channel, 0) == self.seen:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.notifier.cond.wait(remaining)
+
+            self.seen = self.notifier.counters[self.channel]
+
+        return True
+
+    def close(self):
+        pass
+
+
+class LocalNotifier(object):
+    """In-process stand-in for RedisNotifier, used by tests and single
+    process development servers"""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.counters = {}
+
+    def publish(self, channel, message=''):
+        with self.cond:
+            self.counters[channel] = self.counters.get(channel, 0) + 1
+            self.cond.notify_all()
+
+    def subscribe(self, channel):
+        return LocalSubscription(self, channel)
+
+
+class SleepSubscription(object):
+    # Used when Redis is unavailable, callers fall back to re-checking
+    def wait(self, timeout):
+        time.sleep(max(timeout, 0))
+        return False
+
+    def close(self):
+        pass
+
+
+class RedisSubscription(object):
+    def __init__(self, client, channel):
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            if self.pubsub.get_message(timeout=remaining):
+                return True
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisNotifier(object):
+    def __init__(self, url):
+        self.redis = redis.StrictRedis.from_url(url)
+
+    def publish(self, channel, message=''):
+        try:
+            self.redis.publish(channel, message)
+        except redis.RedisError:
+            # Notifications are best effort, waiters re-check periodically
+            pass
+
+    def subscribe(self, channel):
+        try:
+            return RedisSubscription(self.redis, channel)
+        except redis.RedisError:
+            return SleepSubscription()
+
+
+_notifier = None
+
+def getNotifier():
+    global _notifier
+
+    if _notifier is None:
+        if settings.SIDELOADER_NOTIFIER == 'local':
+            _notifier = LocalNotifier()
+        else:
+            _notifier = RedisNotifier(settings.BROKER_URL)
+
+    return _notifier
+
+def buildChannel(build_id):
+    return 'sideloader.build.%s' % build_id
+
+def notifyBuild(build):
+    """Wake up anything waiting on this build's log or state. Build workers
+    should call this after writing to the build"""
+    getNotifier().publish(buildChannel(build.id), str(build.state))
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Content addressed package store
+#
+# Package files live once under .sha256/ in SIDELOADER_PACKAGE_ROOT,
+# named by their SHA-256 digest. The names published under
+# SIDELOADER_PACKAGEURL are symlinks to them, so identical packages from
+# different builds or repos share one file. A worker that already knows
+# a package's digest can check has() and publish by link() without
+# uploading it again.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+
+BLOBS = '.sha256'
+
+def fileDigest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), ''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+class PackageStore(object):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def blobPath(self, digest):
+        if not (len(digest) == 64 and digest.isalnum()):
+            raise ValueError('Bad digest %r' % digest)
+
+        return os.path.join(self.root, BLOBS, digest[:2], digest)
+
+    def namePath(self, name):
+        path = os.path.normpath(os.path.join(self.root, name))
+
+        if (not path.startswith(self.root + os.sep)) or (
+                os.path.relpath(path, self.root).split(os.sep)[0] == BLOBS):
+            raise ValueError('Bad package name %r' % name)
+
+        return path
+
+    def makeDirs(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        return directory
+
+    def touch(self, blob):
+        """Marks a blob as just used so collect() leaves it alone, returns
+        False if it doesn't exist"""
+        try:
+            os.utime(blob, None)
+        except OSError:
+            return False
+
+        return True
+
+    def has(self, digest):
+        return os.path.exists(self.blobPath(digest))
+
+    def digest(self, name):
+        """Digest of a published package, or None"""
+        try:
+            target = os.readlink(self.namePath(name))
+        except OSError:
+            return None
+
+        return os.path.basename(target)
+
+    def link(self, digest, name):
+        """Publishes the stored blob digest as name, replacing whatever
+        was there. The blob must already be stored"""
+        blob = self.blobPath(digest)
+        if not self.touch(blob):
+            raise KeyError(digest)
+
+        path = self.namePath(name)
+        directory = self.makeDirs(path)
+
+        # Swap the new link into place so the name never goes missing
+        tmp = os.path.join(directory, '.tmp%s' % os.urandom(8).encode('hex'))
+        os.symlink(os.path.relpath(blob, directory), tmp)
+        os.rename(tmp, path)
+
+    def add(self, source):
+        """Stores the file at path source unless an identical one is
+        stored already. Returns the digest and whether it was new"""
+        digest = fileDigest(source)
+        blob = self.blobPath(digest)
+
+        if self.touch(blob):
+            return digest, False
+
+        directory = self.makeDirs(blob)
+
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.chmod(tmp, 0644)
+            os.rename(tmp, blob)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+        return digest, True
+
+    def publish(self, source, name):
+        """Stores and publishes a package file, returns its digest"""
+        digest = self.add(source)[0]
+        if self.digest(name) != digest:
+            self.link(digest, name)
+
+        return digest
+
+    def collect(self, grace=86400):
+        """Removes blobs that no published name links to. Blobs newer
+        than grace seconds are kept, they may be about to be linked"""
+        referenced = set()
+        for directory, dirs, files in os.walk(self.root):
+            if directory == self.root and BLOBS in dirs:
+                dirs.remove(BLOBS)
+
+            for name in files:
+                path = os.path.join(directory, name)
+                if os.path.islink(path):
+                    referenced.add(os.path.basename(os.readlink(path)))
+
+        cutoff = time.time() - grace
+        removed = 0
+        for directory, dirs, files in os.walk(os.path.join(self.root, BLOBS)):
+            for digest in files:
+                path = os.path.join(directory, digest)
+                if (digest not in referenced) and (
+                        os.path.getmtime(path) < cutoff):
+                    os.unlink(path)
+                    removed += 1
+
+        return removed
+
+
+_store = None
+
+def getPackageStore():
+    global _store
+
+    if _store is None:
+        _store = PackageStore(settings.SIDELOADER_PACKAGE_ROOT)
+
+    return _store
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Project membership cache
+#
+# The ids of each user's projects are cached for permission checks.
+# Membership changes drop the cached ids straight away and again once
+# the change has committed, so a request that read the old membership
+# just before the commit can't leave it cached. Django before 1.9 has no
+# commit hooks, there the second invalidation runs when the request that
+# made the change finishes.
+
+import threading
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import transaction
+from django.dispatch import receiver
+
+
+_pending = threading.local()
+
+def projectsCacheKey(user_id):
+    return 'sideloader.projects.%s' % user_id
+
+def invalidateProjectPermissions(user_ids):
+    keys = [projectsCacheKey(i) for i in user_ids]
+    cache.delete_many(keys)
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: cache.delete_many(keys))
+    elif transaction.get_connection().in_atomic_block:
+        _pending.__dict__.setdefault('keys', set()).update(keys)
+
+@receiver(request_finished)
+def requestFinished(sender, **kwargs):
+    keys = _pending.__dict__.pop('keys', None)
+    if keys:
+        cache.delete_many(list(keys))
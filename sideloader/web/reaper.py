@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Build reaper
+#
+# reap() fails builds whose last heartbeat (see heartbeats) is more than
+# SIDELOADER_BUILD_TIMEOUT seconds old. Dispatching a build counts as
+# its first beat, so a worker that dies before it sends one is caught
+# too. Builds with no beat at all were dispatched before heartbeats were
+# recorded and are left alone.
+#
+# reap() also fails builds that were admitted but are no longer in the
+# build queue, for instance because Redis lost its data. Nothing would
+# ever start them, and they would hold their build slot forever.
+
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from sideloader.web import buildqueue, buildlog, dashboard, notify
+from sideloader.web.heartbeats import HEARTBEAT_KEY
+from sideloader.web.redisclient import getRedis
+from sideloader.db import models
+
+
+def failBuild(build, message):
+    """Marks an in-progress build failed unless it changed in the
+    meantime. Returns the failed build, or None"""
+    claimed = models.Build.objects.filter(
+        id=build.id, state=0, task_id=build.task_id).update(state=2)
+
+    if not claimed:
+        return None
+
+    build.state = 2
+    buildlog.appendLog(build.id, message)
+
+    # The update skipped the post_save handling of finished builds
+    dashboard.invalidateDashboard()
+    notify.notifyBuild(build)
+    buildqueue.buildFinished(build)
+
+    return build
+
+def reapLost(timeout, now):
+    """Fails builds admitted more than timeout seconds ago that were
+    never dispatched and are not in the build queue"""
+    cutoff = datetime.fromtimestamp(now - timeout, timezone.utc)
+
+    waiting = list(models.Build.objects.filter(state=0,
+        build_time__lt=cutoff).filter(Q(task_id__isnull=True) | Q(task_id='')
+        ).select_related('project').defer('log'))
+
+    if not waiting:
+        return []
+
+    queued = set(entry['build'] for entry in buildqueue.getQueue())
+
+    reaped = []
+    for build in waiting:
+        if build.id not in queued:
+            failed = failBuild(build, '\nBuild failed: it was lost from the '
+                'build queue before it started\n')
+            if failed:
+                reaped.append(failed)
+
+    return reaped
+
+def reap(timeout=None, now=None):
+    """Fails running builds whose last heartbeat is more than timeout
+    seconds old, and lost queued builds. Returns the failed builds"""
+    timeout = timeout or settings.SIDELOADER_BUILD_TIMEOUT
+    now = now or time.time()
+    r = getRedis()
+
+    # Uses the partial index on in-progress builds
+    builds = list(buildqueue.runningBuilds().select_related('project'
+        ).defer('log'))
+
+    tasks = set(b.task_id for b in builds)
+
+    pipe = r.pipeline(transaction=False)
+    for build in builds:
+        pipe.zscore(HEARTBEAT_KEY, build.task_id)
+    pipe.zrange(HEARTBEAT_KEY, 0, -1)
+    replies = pipe.execute()
+
+    beats = dict(zip([b.task_id for b in builds], replies[:-1]))
+    finished = [t for t in replies[-1] if t not in tasks]
+
+    pipe = r.pipeline(transaction=False)
+    if finished:
+        pipe.zrem(HEARTBEAT_KEY, *finished)
+
+    reaped = []
+    for build in builds:
+        last = beats[build.task_id]
+
+        if (last is not None) and (now - last > timeout):
+            failed = failBuild(build, '\nBuild failed: no heartbeat from the '
+                'worker for %d seconds\n' % (now - last))
+            if failed:
+                reaped.append(failed)
+            pipe.zrem(HEARTBEAT_KEY, build.task_id)
+
+    pipe.execute()
+
+    return reaped + reapLost(timeout, now)
@@ -0,0 +1,15 @@
+import redis
+
+from django.conf import settings
+
+
+_client = None
+
+def getRedis():
+    """Shared Redis client on BROKER_URL"""
+    global _client
+
+    if _client is None:
+        _client = redis.StrictRedis.from_url(settings.BROKER_URL)
+
+    return _client
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Scheduled releases
+#
+# Scheduled pushes are stored as ScheduledRelease rows and fired by
+# ReleaseScheduler.tick(), normally from the release_scheduler command.
+# Each tick is one indexed query for due rows. Redis keeps a sorted set
+# of due times so an idle tick can usually skip the database entirely.
+# The set is rebuilt from the database whenever Redis has lost it.
+
+import calendar
+import time
+
+import redis
+
+from django.utils import timezone
+
+from sideloader.web import tasks
+from sideloader.web.models import ScheduledRelease
+from sideloader.web.redisclient import getRedis
+
+
+DUE_KEY = 'sideloader.releasequeue.due'
+SYNCED_KEY = 'sideloader.releasequeue.synced'
+
+def timestamp(t):
+    return calendar.timegm(t.utctimetuple())
+
+def scheduleRelease(build_id, flow, due_at):
+    scheduled = ScheduledRelease.objects.create(
+        build_id=build_id, flow=flow, due_at=due_at)
+
+    try:
+        getRedis().zadd(DUE_KEY, timestamp(due_at), scheduled.id)
+    except redis.RedisError:
+        pass
+
+    return scheduled
+
+
+class ReleaseScheduler(object):
+    """Fires scheduled releases once they are due.
+
+    clock returns the current aware datetime and can be replaced in
+    tests. Releases that became due while the scheduler was down are
+    fired on the next tick, unless they are more than max_lateness
+    seconds late, in which case they are marked missed."""
+    def __init__(self, clock=timezone.now, max_lateness=None, redis=None,
+                 full_check=60):
+        self.clock = clock
+        self.max_lateness = max_lateness
+        self.redis = redis
+        self.full_check = full_check
+        self.last_full_check = None
+
+    def getRedis(self):
+        return self.redis or getRedis()
+
+    def sync(self):
+        """Rebuild the due set from the database"""
+        r = self.getRedis()
+        pending = ScheduledRelease.objects.filter(
+            state=ScheduledRelease.PENDING).values_list('id', 'due_at')
+
+        pipe = r.pipeline()
+        pipe.delete(DUE_KEY)
+        for id, due_at in pending:
+            pipe.zadd(DUE_KEY, timestamp(due_at), id)
+        pipe.set(SYNCED_KEY, 1)
+        pipe.execute()
+
+    def anythingDue(self, now):
+        """Cheap check against Redis, errs on the side of True"""
+        if (self.last_full_check is None or
+            timestamp(now) - self.last_full_check >= self.full_check):
+            self.last_full_check = timestamp(now)
+            return True
+
+        try:
+            r = self.getRedis()
+            if not r.exists(SYNCED_KEY):
+                self.sync()
+
+            return bool(r.zrangebyscore(DUE_KEY, '-inf', timestamp(now),
+                start=0, num=1))
+        except redis.RedisError:
+            return True
+
+    def fire(self, scheduled, now):
+        late = timestamp(now) - timestamp(scheduled.due_at)
+
+        if self.max_lateness is not None and late > self.max_lateness:
+            state = ScheduledRelease.MISSED
+        else:
+            state = ScheduledRelease.FIRED
+
+        # Claim the row, so concurrent schedulers fire it exactly once
+        claimed = ScheduledRelease.objects.filter(id=scheduled.id,
+            state=ScheduledRelease.PENDING).update(state=state, fired_at=now)
+
+        if claimed and state == ScheduledRelease.FIRED:
+            try:
+                tasks.pushRelease(scheduled.build_id, scheduled.flow)
+            except Exception:
+                ScheduledRelease.objects.filter(id=scheduled.id).update(
+                    state=ScheduledRelease.FAILED)
+                state = ScheduledRelease.FAILED
+
+        try:
+            self.getRedis().zrem(DUE_KEY, scheduled.id)
+        except redis.RedisError:
+            pass
+
+        return claimed and state
+
+    def tick(self):
+        """Fires everything that is due. Returns the ScheduledReleases
+        this call fired"""
+        now = self.clock()
+
+        if not self.anythingDue(now):
+            return []
+
+        due = ScheduledRelease.objects.filter(
+            state=ScheduledRelease.PENDING, due_at__lte=now
+        ).select_related('flow').order_by('due_at')
+
+        fired = []
+        for scheduled in due:
+            if self.fire(scheduled, now) == ScheduledRelease.FIRED:
+                fired.append(scheduled)
+
+        return fired
+
+    def run(self, interval=5, sleep=time.sleep):
+        while True:
+            self.tick()
+            sleep(interval)
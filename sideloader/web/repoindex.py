@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# Package repository indexes
+#
+# APT repos keep the control stanza of every package in a cache file in
+# the repo directory. Adding a package parses only that package, merges
+# its stanza into the cache and writes Packages, its compressed variants
+# and Release from the cache. YUM repos are updated with createrepo
+# --update, which reuses the metadata of packages it has seen before.
+#
+# Every index file is written to a temporary file and renamed into
+# place, and updates of one repo are serialised with a lock file.
+#
+# Full rebuilds rescan every package, so they are queued in Redis and
+# run by the repo_indexer command rather than in a request.
+
+import bz2
+import collections
+import contextlib
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import tarfile
+import tempfile
+import time
+from cStringIO import StringIO
+
+from django.conf import settings
+
+from sideloader.web import packages
+from sideloader.web.redisclient import getRedis
+
+
+CACHE = '.packages.json'
+LOCK = '.lock'
+REBUILD_KEY = 'sideloader.repo.rebuilds'
+
+def atomicWrite(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+def gzipData(data):
+    buf = StringIO()
+    # A fixed mtime keeps unchanged indexes byte for byte identical
+    f = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+def fileHashes(path):
+    hashes = [hashlib.md5(), hashlib.sha1(), hashlib.sha256()]
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), ''):
+            size += len(block)
+            for h in hashes:
+                h.update(block)
+
+    return [size] + [h.hexdigest() for h in hashes]
+
+def controlFromTar(name, data):
+    if name.endswith('.xz') or name.endswith('.zst'):
+        tool = 'xz' if name.endswith('.xz') else 'zstd'
+        proc = subprocess.Popen([tool, '-dc'], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        data = proc.communicate(data)[0]
+        if proc.returncode:
+            raise ValueError('Could not decompress %s' % name)
+
+    tar = tarfile.open(fileobj=StringIO(data))
+    for member in tar:
+        if member.isfile() and os.path.basename(member.name) == 'control':
+            return tar.extractfile(member).read()
+
+    raise ValueError('No control file in %s' % name)
+
+def debControl(path):
+    """The control file of a .deb, read from its ar archive"""
+    with open(path, 'rb') as f:
+        if f.read(8) != '!<arch>\n':
+            raise ValueError('%s is not a deb' % path)
+
+        while True:
+            header = f.read(60)
+            if len(header) < 60:
+                break
+
+            name = header[:16].strip().rstrip('/')
+            size = int(header[48:58])
+
+            if name.startswith('control.tar'):
+                return controlFromTar(name, f.read(size))
+
+            # Members are padded to an even length
+            f.seek(size + size % 2, 1)
+
+    raise ValueError('No control archive in %s' % path)
+
+def parseControl(text):
+    fields = collections.OrderedDict()
+    last = None
+
+    for line in text.decode('utf-8').splitlines():
+        if line[:1] in (' ', '\t') and last:
+            fields[last] += '\n' + line
+        elif ':' in line:
+            last, value = line.split(':', 1)
+            fields[last] = value.strip()
+
+    return fields
+
+def debStanza(path, filename):
+    fields = parseControl(debControl(path))
+    size, md5, sha1, sha256 = fileHashes(path)
+
+    fields['Filename'] = filename
+    fields['Size'] = str(size)
+    fields['MD5sum'] = md5
+    fields['SHA1'] = sha1
+    fields['SHA256'] = sha256
+
+    return fields
+
+
+class RepoIndex(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    @contextlib.contextmanager
+    def lock(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        with open(os.path.join(self.directory, LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def packageFiles(self, extension):
+        for directory, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(extension):
+                    yield os.path.relpath(os.path.join(directory, name),
+                        self.directory)
+
+
+class AptIndex(RepoIndex):
+    """A flat APT repository, usable as 'deb <url> ./'"""
+
+    def load(self):
+        try:
+            with open(os.path.join(self.directory, CACHE)) as f:
+                return json.load(f, object_pairs_hook=collections.OrderedDict)
+        except (IOError, ValueError):
+            return None
+
+    def scan(self):
+        return dict((filename, debStanza(
+            os.path.join(self.directory, filename), filename))
+            for filename in self.packageFiles('.deb'))
+
+    def add(self, path):
+        """Adds or replaces the package at path, which must be inside
+        the repo directory"""
+        filename = os.path.relpath(path, self.directory)
+
+        with self.lock():
+            stanzas = self.load()
+            if stanzas is None:
+                stanzas = self.scan()
+            else:
+                # Forget packages that have been removed since
+                for name in list(stanzas):
+                    if not os.path.exists(os.path.join(self.directory, name)):
+                        del stanzas[name]
+
+            stanzas[filename] = debStanza(path, filename)
+            self.write(stanzas)
+
+    def rebuild(self):
+        with self.lock():
+            self.write(self.scan())
+
+    def write(self, stanzas):
+        ordered = sorted(stanzas.values(), key=lambda s: (
+            s.get('Package'), s.get('Version'), s.get('Architecture')))
+
+        index = u'\n'.join(u''.join(u'%s: %s\n' % item
+            for item in stanza.items()) for stanza in ordered)
+        index = index.encode('utf-8')
+
+        files = collections.OrderedDict([
+            ('Packages', index),
+            ('Packages.gz', gzipData(index)),
+            ('Packages.bz2', bz2.compress(index)),
+        ])
+
+        release = ['Date: %s' % time.strftime(
+            '%a, %d %b %Y %H:%M:%S UTC', time.gmtime())]
+        for field, algorithm in (('MD5Sum', hashlib.md5),
+                ('SHA256', hashlib.sha256)):
+            release.append('%s:' % field)
+            for name, data in files.items():
+                release.append(' %s %16d %s' % (
+                    algorithm(data).hexdigest(), len(data), name))
+
+        atomicWrite(os.path.join(self.directory, CACHE), json.dumps(stanzas))
+        for name, data in files.items():
+            atomicWrite(os.path.join(self.directory, name), data)
+        atomicWrite(os.path.join(self.directory, 'Release'),
+            '\n'.join(release) + '\n')
+
+
+class YumIndex(RepoIndex):
+    def createrepo(self, *args):
+        subprocess.check_call([settings.SIDELOADER_CREATEREPO] +
+            list(args) + [self.directory])
+
+    def add(self, path):
+        with self.lock():
+            if os.path.isdir(os.path.join(self.directory, 'repodata')):
+                self.createrepo('--update')
+            else:
+                self.createrepo()
+
+    def rebuild(self):
+        with self.lock():
+            self.createrepo()
+
+
+def getIndex(directory, package_type):
+    if package_type == 'rpm':
+        return YumIndex(directory)
+
+    return AptIndex(directory)
+
+def publishToRepo(repo_name, source, package_type):
+    """Publishes a package file into a package repo and updates the
+    repo's index. Returns the package's digest"""
+    store = packages.getPackageStore()
+    name = '%s/%s' % (repo_name, os.path.basename(source))
+
+    digest = store.publish(source, name)
+    getIndex(store.namePath(repo_name), package_type).add(
+        store.namePath(name))
+
+    return digest
+
+def rebuildIndexes(repo_name):
+    """Rebuilds a repo's indexes from every package in it"""
+    directory = packages.getPackageStore().namePath(repo_name)
+
+    for index, extension in ((AptIndex(directory), '.deb'),
+            (YumIndex(directory), '.rpm')):
+        if any(index.packageFiles(extension)):
+            index.rebuild()
+
+def queueRebuild(repo_name):
+    """Queues a rebuild of a repo's indexes, once however often it is
+    asked for before it runs"""
+    getRedis().sadd(REBUILD_KEY, repo_name)
+
+def rebuildQueued():
+    """Rebuilds every queued repo, returns their names"""
+    r = getRedis()
+    rebuilt = []
+
+    while True:
+        repo_name = r.spop(REBUILD_KEY)
+        if repo_name is None:
+            return rebuilt
+
+        try:
+            rebuildIndexes(repo_name)
+        except Exception:
+            r.sadd(REBUILD_KEY, repo_name)
+            raise
+
+        rebuilt.append(repo_name)
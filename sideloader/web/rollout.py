@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+# Server rollouts
+#
+# A rollout deploys a build to the servers of a stream in waves, for
+# instance one canary, then 10% of the servers, then the rest. Servers in
+# a wave are deployed concurrently. Between waves the deployed servers
+# must pass a health check, and the rollout aborts if too large a share
+# of the servers so far have failed.
+#
+# Progress is kept in Redis as one character per server, updated in
+# place with SETRANGE, next to a JSON description of the rollout.
+#
+# startRollout() only queues the rollout. RolloutRunner, normally run by
+# the rollout_runner command, claims queued rollouts and holds a lease
+# on them while they run. A rollout whose runner died is put back on the
+# queue once its lease lapses, and resumes with the servers it had not
+# finished.
+
+import json
+import math
+import threading
+import time
+import uuid
+import Queue
+
+import redis
+
+from django.conf import settings
+
+from sideloader.web import specter
+from sideloader.web.redisclient import getRedis
+
+
+PENDING = '.'
+RUNNING = 'R'
+DONE = 'D'
+FAILED = 'F'
+SKIPPED = 'S'
+
+def progressKey(rollout_id):
+    return 'sideloader.rollout.%s.progress' % rollout_id
+
+def infoKey(rollout_id):
+    return 'sideloader.rollout.%s' % rollout_id
+
+def leaseKey(rollout_id):
+    return 'sideloader.rollout.%s.lease' % rollout_id
+
+def buildKey(build_id, flow_id):
+    return 'sideloader.rollout.build.%s.%s' % (build_id, flow_id)
+
+QUEUE_KEY = 'sideloader.rollouts'
+ACTIVE_KEY = 'sideloader.rollouts.active'
+
+def waveSizes(total, waves):
+    """Splits total servers into waves. Integers are server counts and
+    floats are fractions of the total, the last wave takes the rest"""
+    sizes = []
+    remaining = total
+
+    for wave in waves[:-1]:
+        if isinstance(wave, float):
+            size = int(math.ceil(wave * total))
+        else:
+            size = wave
+
+        size = min(max(size, 1), remaining)
+        if size:
+            sizes.append(size)
+            remaining -= size
+
+    if remaining:
+        sizes.append(remaining)
+
+    return sizes
+
+
+class Rollout(object):
+    """progress resumes an interrupted rollout, servers that were being
+    deployed when it stopped are deployed again"""
+    def __init__(self, servers, deploy, check=None, waves=(1, 0.1, 1.0),
+                 concurrency=10, abort_ratio=0.2, rollout_id=None,
+                 redis=None, progress=None):
+        self.servers = list(servers)
+        self.deploy = deploy
+        self.check = check
+        self.waves = waves
+        self.concurrency = concurrency
+        self.abort_ratio = abort_ratio
+        self.id = rollout_id or uuid.uuid4().hex
+        self.redis = redis
+
+        if progress and len(progress) == len(self.servers):
+            self.progress = [PENDING if state == RUNNING else state
+                for state in progress]
+        else:
+            self.progress = [PENDING] * len(self.servers)
+
+    def getRedis(self):
+        return self.redis or getRedis()
+
+    def setState(self, index, state):
+        self.progress[index] = state
+        try:
+            self.getRedis().setrange(progressKey(self.id), index, state)
+        except redis.RedisError:
+            pass
+
+    def saveInfo(self, status, **info):
+        info.update({
+            'status': status,
+            'servers': [str(s) for s in self.servers]
+        })
+        try:
+            r = self.getRedis()
+            r.setex(infoKey(self.id), settings.SIDELOADER_ROLLOUT_TTL,
+                json.dumps(info))
+            r.setex(progressKey(self.id), settings.SIDELOADER_ROLLOUT_TTL,
+                ''.join(self.progress))
+        except redis.RedisError:
+            pass
+
+    def deployWave(self, indexes):
+        indexes = [i for i in indexes if self.progress[i] == PENDING]
+
+        work = Queue.Queue()
+        for i in indexes:
+            work.put(i)
+
+        def worker():
+            while True:
+                try:
+                    i = work.get_nowait()
+                except Queue.Empty:
+                    return
+
+                self.setState(i, RUNNING)
+                try:
+                    ok = self.deploy(self.servers[i])
+                except Exception:
+                    ok = False
+                self.setState(i, DONE if ok else FAILED)
+
+        threads = [threading.Thread(target=worker)
+            for i in range(min(self.concurrency, len(indexes)))]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+    def run(self, **info):
+        """Runs the rollout to completion, returns 'complete' or the
+        reason it was aborted"""
+        self.saveInfo('running', **info)
+
+        start = 0
+        status = 'complete'
+
+        for size in waveSizes(len(self.servers), self.waves):
+            wave = range(start, start + size)
+            start += size
+
+            self.deployWave(wave)
+
+            attempted = self.progress[:start]
+            failed = attempted.count(FAILED)
+
+            if failed > self.abort_ratio * len(attempted):
+                status = 'aborted: %s of %s servers failed' % (
+                    failed, len(attempted))
+                break
+
+            deployed = [self.servers[i] for i in wave
+                if self.progress[i] == DONE]
+
+            if self.check and deployed and not self.check(deployed):
+                status = 'aborted: health check failed'
+                break
+
+        for i in range(start, len(self.servers)):
+            self.setState(i, SKIPPED)
+
+        self.saveInfo(status, **info)
+
+        return status
+
+def getRollout(rollout_id):
+    """Returns the stored info of a rollout with its progress string"""
+    r = getRedis()
+    info = r.get(infoKey(rollout_id))
+    if info is None:
+        return None
+
+    info = json.loads(info)
+    info['progress'] = r.get(progressKey(rollout_id)) or ''
+
+    return info
+
+def latestRollout(build_id, flow_id):
+    """Id of the last rollout of a build to a stream, or None"""
+    return getRedis().get(buildKey(build_id, flow_id))
+
+def specterClient(name):
+    return specter.SpecterClient(name, settings.SPECTER_AUTHCODE,
+        settings.SPECTER_SECRET)
+
+def specterDeploy(build_id):
+    """Deploy function that asks each server's Specter agent to deploy"""
+    def deploy(name):
+        return specterClient(name).postRequest(
+            settings.SIDELOADER_SPECTER_DEPLOY_PATH,
+            json.dumps({'build_id': build_id})) is not None
+    return deploy
+
+def specterCheck(names):
+    """Health gate, every server's Specter agent must answer"""
+    results = specter.batch([(specterClient(name),
+        settings.SIDELOADER_SPECTER_HEALTH_PATH, None) for name in names],
+        workers=settings.SIDELOADER_ROLLOUT_CONCURRENCY)
+
+    return not any(result.error for result in results)
+
+def serverTargets(flow):
+    """Servers of the stream's targets that deploy in server mode"""
+    return [target.server for target in flow.target_set.filter(
+        stream_mode='server').select_related('server').order_by('server__name')
+        if target.server is not None]
+
+def startRollout(build_id, flow, servers):
+    """Queues a rollout for RolloutRunner, returns its id"""
+    rollout_id = uuid.uuid4().hex
+    names = [server.name for server in servers]
+    ttl = settings.SIDELOADER_ROLLOUT_TTL
+
+    pipe = getRedis().pipeline()
+    pipe.setex(infoKey(rollout_id), ttl, json.dumps({
+        'status': 'queued',
+        'servers': names,
+        'build': build_id,
+        'flow': flow.id,
+        'project': flow.project_id
+    }))
+    pipe.setex(progressKey(rollout_id), ttl, PENDING * len(names))
+    pipe.setex(buildKey(build_id, flow.id), ttl, rollout_id)
+    pipe.lpush(QUEUE_KEY, rollout_id)
+    pipe.execute()
+
+    return rollout_id
+
+
+class RolloutRunner(object):
+    """Runs queued rollouts one at a time. Several runners can share the
+    queue"""
+    def __init__(self, lease=60, redis=None):
+        self.lease = lease
+        self.redis = redis
+        # Active rollouts seen without a lease on the last recover()
+        self.suspects = set()
+
+    def getRedis(self):
+        return self.redis or getRedis()
+
+    def recover(self):
+        """Requeues active rollouts whose runner has gone away. A rollout
+        has to be seen without a lease twice in a row, so one that was
+        only just claimed isn't taken from its runner"""
+        r = self.getRedis()
+        suspects = set()
+
+        for rollout_id in r.lrange(ACTIVE_KEY, 0, -1):
+            if r.exists(leaseKey(rollout_id)):
+                continue
+
+            if rollout_id in self.suspects:
+                # Only whoever removes it from the active list requeues it
+                if r.lrem(ACTIVE_KEY, 0, rollout_id):
+                    r.rpush(QUEUE_KEY, rollout_id)
+            else:
+                suspects.add(rollout_id)
+
+        self.suspects = suspects
+
+    def renew(self, rollout_id, done):
+        while not done.wait(self.lease / 3.0):
+            try:
+                self.getRedis().setex(leaseKey(rollout_id), self.lease, 1)
+            except redis.RedisError:
+                pass
+
+    def execute(self, rollout_id):
+        info = getRollout(rollout_id)
+
+        if info and info['status'] in ('queued', 'running'):
+            rollout = Rollout(info['servers'], specterDeploy(info['build']),
+                check=specterCheck,
+                waves=settings.SIDELOADER_ROLLOUT_WAVES,
+                concurrency=settings.SIDELOADER_ROLLOUT_CONCURRENCY,
+                abort_ratio=settings.SIDELOADER_ROLLOUT_ABORT_RATIO,
+                rollout_id=rollout_id, redis=self.redis,
+                progress=info['progress'])
+
+            meta = dict(build=info['build'], flow=info['flow'],
+                project=info['project'])
+            try:
+                rollout.run(**meta)
+            except Exception, e:
+                rollout.saveInfo('aborted: %s' % e, **meta)
+
+    def runOne(self, timeout=5):
+        """Claims and runs the next queued rollout. Returns its id, or None
+        if nothing was queued within timeout seconds"""
+        r = self.getRedis()
+        rollout_id = r.brpoplpush(QUEUE_KEY, ACTIVE_KEY, timeout)
+        if rollout_id is None:
+            return None
+
+        r.setex(leaseKey(rollout_id), self.lease, 1)
+
+        done = threading.Event()
+        renewer = threading.Thread(target=self.renew, args=(rollout_id, done))
+        renewer.daemon = True
+        renewer.start()
+
+        try:
+            self.execute(rollout_id)
+        finally:
+            done.set()
+            renewer.join()
+
+            pipe = r.pipeline()
+            pipe.lrem(ACTIVE_KEY, 0, rollout_id)
+            pipe.delete(leaseKey(rollout_id))
+            pipe.execute()
+
+        return rollout_id
+
+    def run(self, interval=5, sleep=time.sleep):
+        while True:
+            try:
+                self.recover()
+                self.runOne(interval)
+            except redis.RedisError:
+                sleep(interval)
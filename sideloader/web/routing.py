@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Push routing
+#
+# Each project's streams are indexed by the normalised URL of their repo
+# and their branch, so a push resolves to the streams it affects with one
+# lookup. The index is cached per project and dropped whenever one of
+# the project's repos or streams changes.
+
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from sideloader.db import models
+
+
+# Repository URLs in push payloads, most specific first
+PAYLOAD_URLS = ('clone_url', 'ssh_url', 'git_url', 'url', 'html_url')
+
+URL_RE = re.compile(
+    r'^(?:[\w+]+://)?(?:[^@/]+@)?([^/:]+)(?::\d+)?[:/]+(.+?)(?:\.git)?/*$')
+
+def normaliseUrl(url):
+    """Reduces the different URLs of one repository to host/path"""
+    url = (url or '').strip().lower()
+    match = URL_RE.match(url)
+
+    return '%s/%s' % match.groups() if match else url
+
+def routesKey(project_id):
+    return 'sideloader.routes.%s' % project_id
+
+def buildRoutes(project_id):
+    """{url: {branch: {repo id: [stream ids]}}} for a project"""
+    routes = {}
+
+    streams = models.Stream.objects.filter(repo__project_id=project_id
+        ).values_list('id', 'branch', 'repo_id', 'repo__github_url')
+
+    for stream_id, branch, repo_id, url in streams:
+        routes.setdefault(normaliseUrl(url), {}).setdefault(
+            branch, {}).setdefault(repo_id, []).append(stream_id)
+
+    return routes
+
+def getRoutes(project_id):
+    routes = cache.get(routesKey(project_id))
+
+    if routes is None:
+        routes = buildRoutes(project_id)
+        cache.set(routesKey(project_id), routes,
+            settings.SIDELOADER_ROUTES_CACHE_TTL)
+
+    return routes
+
+def invalidateRoutes(project_id):
+    cache.delete(routesKey(project_id))
+
+def routedBranches(routes):
+    return set(branch for branches in routes.values() for branch in branches)
+
+def resolvePush(routes, repository, branch):
+    """{repo id: [stream ids]} of the streams a push to branch of the
+    payload's repository affects"""
+    if not isinstance(repository, dict):
+        return {}
+
+    for field in PAYLOAD_URLS:
+        url = repository.get(field)
+        if isinstance(url, basestring) and url:
+            repos = routes.get(normaliseUrl(url), {}).get(branch)
+            if repos:
+                return repos
+
+    return {}
@@ -113,6 +113,13 @@ LOGGING = {
 
 BROKER_URL = 'redis://localhost:6379/0'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+
 LOGIN_REDIRECT_URL = '/'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
@@ -124,6 +131,105 @@ SIDELOADER_DOMAIN = socket.getfqdn()
 SIDELOADER_FROM = 'Sideloader <no-reply@%s>' % SIDELOADER_DOMAIN
 SIDELOADER_PACKAGEURL = "http://%s/packages" % SIDELOADER_DOMAIN
 
+# Published packages are kept in a content addressed store under
+# SIDELOADER_PACKAGE_ROOT. Set SIDELOADER_PACKAGE_SENDFILE to 'X-Sendfile'
+# or 'X-Accel-Redirect' to have the front end server send package files,
+# the latter mapping SIDELOADER_PACKAGE_ACCEL_PREFIX to the package root.
+SIDELOADER_PACKAGE_ROOT = abspath('packages')
+SIDELOADER_PACKAGE_SENDFILE = None
+SIDELOADER_PACKAGE_ACCEL_PREFIX = '/protected/packages/'
+
+# Used to index YUM package repos
+SIDELOADER_CREATEREPO = 'createrepo'
+
+# Project membership per user, invalidated when membership changes
+SIDELOADER_PERMISSION_CACHE_TTL = 600
+
+# Running builds are failed by the build_reaper command when neither their
+# dispatch nor a heartbeat from their worker (POSTed to api/heartbeat/<task
+# id>) is more recent than this many seconds. Admitted builds missing from
+# the build queue are failed once they are this old
+SIDELOADER_BUILD_TIMEOUT = 300
+
+# Build scheduling. Builds of branches matching SIDELOADER_RELEASE_BRANCHES
+# are started first. SIDELOADER_BUILD_ESTIMATE (seconds) is used for
+# estimated start times in the queue
+SIDELOADER_MAX_BUILDS = 10
+SIDELOADER_MAX_PROJECT_BUILDS = 2
+SIDELOADER_RELEASE_BRANCHES = ['master', 'release/*', 'release-*']
+SIDELOADER_BUILD_ESTIMATE = 600
+
+# Scheduled releases more than this many seconds overdue (for instance
+# after scheduler downtime) are marked missed. None fires them all
+SIDELOADER_SCHEDULE_MAX_LATENESS = None
+
+# Rollouts to streams with server targets. Waves are server counts or
+# fractions of the stream's servers, the last wave takes the rest
+SIDELOADER_ROLLOUT_WAVES = (1, 0.1, 1.0)
+SIDELOADER_ROLLOUT_CONCURRENCY = 20
+SIDELOADER_ROLLOUT_ABORT_RATIO = 0.2
+SIDELOADER_ROLLOUT_TTL = 7 * 86400
+# Seconds before a rollout whose runner died is resumed by another
+SIDELOADER_ROLLOUT_LEASE = 60
+SIDELOADER_SPECTER_DEPLOY_PATH = 'sideloader/deploy'
+SIDELOADER_SPECTER_HEALTH_PATH = 'status'
+
+# How long sign-off quorum counters are kept in Redis
+SIDELOADER_SIGNOFF_TTL = 30 * 86400
+
+# Seconds between writes of buffered server check-ins to the database
+SIDELOADER_CHECKIN_FLUSH = 5
+
+# Servers that have not checked in for this many seconds are stale
+SIDELOADER_STALE_CHECKIN = 600
+
+# How long webhook delivery ids are remembered to drop redeliveries
+SIDELOADER_DELIVERY_TTL = 86400
+
+# Build webhook lookups are cached per hook hash, unknown hashes for
+# less time. The latency of the last SIDELOADER_HOOK_HISTORY deliveries
+# is kept.
+SIDELOADER_HOOK_CACHE_TTL = 3600
+SIDELOADER_HOOK_MISS_TTL = 60
+SIDELOADER_HOOK_HISTORY = 1000
+
+# Per project index of which streams a push to a repo and branch affects,
+# dropped whenever a repo or stream changes
+SIDELOADER_ROUTES_CACHE_TTL = 3600
+
+# Seconds the cached Rhumba cluster status on the admin page is kept
+# before it is refreshed in the background
+SIDELOADER_CLUSTER_TTL = 10
+
+# Rendered dashboards are also invalidated whenever a build changes state
+SIDELOADER_DASHBOARD_TTL = 30
+
+SIDELOADER_BUILDS_PER_PAGE = 25
+SIDELOADER_RELEASES_PER_PAGE = 5
+
+# Build logs are stored in compressed chunks of this many characters. The
+# build view initially loads only the last SIDELOADER_LOG_TAIL characters.
+SIDELOADER_LOG_CHUNK_SIZE = 65536
+SIDELOADER_LOG_TAIL = 262144
+
+# Prebuilt dependency layers shared between builds, kept under
+# SIDELOADER_ARTIFACT_ROOT, which has to be a filesystem shared by all
+# build workers. The least recently used ones are evicted above
+# SIDELOADER_ARTIFACT_MAX_BYTES. The cache size is measured again every
+# SIDELOADER_ARTIFACT_RESCAN seconds to count other workers' artifacts
+SIDELOADER_ARTIFACT_ROOT = abspath('artifacts')
+SIDELOADER_ARTIFACT_MAX_BYTES = 20 * 1024 ** 3
+SIDELOADER_ARTIFACT_RESCAN = 600
+
+# Long-polling build views. SIDELOADER_NOTIFIER is 'redis' (uses BROKER_URL)
+# or 'local' for a single process without Redis
+SIDELOADER_NOTIFIER = 'redis'
+SIDELOADER_LONGPOLL_TIMEOUT = 25
+SIDELOADER_LONGPOLL_RECHECK = 5
+
+# Compiled Puppet ENC nodes are invalidated on change, the TTL is a backstop
+SIDELOADER_ENC_CACHE_TTL = 3600
+
 SLACK_TOKEN = None
 SLACK_CHANNEL = ''
 SLACK_HOST = 'foo.slack.com'
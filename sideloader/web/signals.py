@@ -0,0 +1,81 @@
+from django.db.models.signals import (post_init, post_save, post_delete,
+    pre_delete, m2m_changed)
+from django.dispatch import receiver
+
+from sideloader.web import (notify, enc, buildqueue, webhooks, routing,
+    dashboard)
+from sideloader.web.permissions import invalidateProjectPermissions
+from sideloader.db import models
+
+
+@receiver(post_init, sender=models.Build)
+def buildLoaded(sender, instance, **kwargs):
+    instance._loaded_state = instance.__dict__.get('state')
+
+@receiver(post_save, sender=models.Build)
+def buildSaved(sender, instance, created, **kwargs):
+    notify.notifyBuild(instance)
+
+    if created or instance.state != instance._loaded_state:
+        dashboard.invalidateDashboard()
+
+        if instance._loaded_state == 0 and instance.state > 0:
+            buildqueue.buildFinished(instance)
+
+        instance._loaded_state = instance.state
+
+@receiver(post_save, sender=models.ServerManifest)
+@receiver(post_delete, sender=models.ServerManifest)
+def serverManifestChanged(sender, instance, **kwargs):
+    enc.invalidateRelease(instance.release_id)
+
+@receiver(post_save, sender=models.Release)
+@receiver(post_delete, sender=models.Release)
+def releaseChanged(sender, instance, **kwargs):
+    enc.invalidateRelease(instance.id)
+
+@receiver(post_save, sender=models.Target)
+@receiver(post_delete, sender=models.Target)
+def targetChanged(sender, instance, **kwargs):
+    enc.invalidateServer(instance.server_id)
+
+@receiver(post_delete, sender=models.Server)
+def serverDeleted(sender, instance, **kwargs):
+    enc.invalidate([instance.name])
+
+@receiver(post_init, sender=models.Project)
+def projectLoaded(sender, instance, **kwargs):
+    instance._loaded_idhash = instance.__dict__.get('idhash')
+
+@receiver(post_save, sender=models.Project)
+@receiver(post_delete, sender=models.Project)
+def projectChanged(sender, instance, **kwargs):
+    webhooks.invalidateHook(instance.idhash,
+        getattr(instance, '_loaded_idhash', None))
+    instance._loaded_idhash = instance.idhash
+
+@receiver(post_save, sender=models.Repo)
+@receiver(post_delete, sender=models.Repo)
+def repoChanged(sender, instance, **kwargs):
+    routing.invalidateRoutes(instance.project_id)
+
+@receiver(post_save, sender=models.Stream)
+@receiver(post_delete, sender=models.Stream)
+def streamChanged(sender, instance, **kwargs):
+    routing.invalidateRoutes(instance.project_id)
+
+@receiver(m2m_changed, sender=models.Project.allowed_users.through)
+def projectMembersChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # A user's projects were changed
+        invalidateProjectPermissions([instance.id])
+    elif action in ('post_add', 'post_remove'):
+        invalidateProjectPermissions(pk_set)
+    elif action == 'pre_clear':
+        invalidateProjectPermissions(
+            instance.allowed_users.values_list('id', flat=True))
+
+@receiver(pre_delete, sender=models.Project)
+def projectDeleted(sender, instance, **kwargs):
+    invalidateProjectPermissions(
+        instance.allowed_users.values_list('id', flat=True))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Release sign-off quorum
+#
+# Each release keeps a Redis set of the sign-offs that have been signed
+# and the number required, so checking the quorum is O(1) per sign-off.
+# The set is seeded from the database whenever it is missing. Adding
+# the same sign-off twice is harmless, so seeding can race safely.
+# Firing the release is guarded by a conditional UPDATE of
+# Release.waiting, so it happens exactly once however many sign-offs
+# complete the quorum at the same time. If the release can't be queued
+# the claim and the sign-off are undone, so signing again retries it.
+
+import redis
+
+from django.conf import settings
+
+from sideloader.web import tasks
+from sideloader.web.redisclient import getRedis
+from sideloader.db import models
+
+
+def signedKey(release_id):
+    return 'sideloader.signoff.%s.signed' % release_id
+
+def requiredKey(release_id):
+    return 'sideloader.signoff.%s.required' % release_id
+
+def requiredSignoffs(release):
+    """Stream.quorum, where 0 means every sign-off is required"""
+    quorum = release.stream.quorum
+    if quorum:
+        return quorum
+
+    return models.ReleaseSignoff.objects.filter(release=release).count()
+
+def signedCount(release, signoff):
+    r = getRedis()
+    key = signedKey(release.id)
+    ttl = settings.SIDELOADER_SIGNOFF_TTL
+
+    if not r.exists(key):
+        r.sadd(key, *models.ReleaseSignoff.objects.filter(
+            release=release, signed=True).values_list('id', flat=True))
+
+    pipe = r.pipeline()
+    pipe.sadd(key, signoff.id)
+    pipe.expire(key, ttl)
+    pipe.scard(key)
+    pipe.get(requiredKey(release.id))
+    added, expired, signed, required = pipe.execute()
+
+    if required is None:
+        required = requiredSignoffs(release)
+        r.setex(requiredKey(release.id), ttl, required)
+
+    return signed, int(required)
+
+def sign(signoff):
+    """Marks signoff as signed and fires its release if that completes
+    the quorum. Returns True if the release was fired"""
+    # Only the first request for a sign-off counts
+    if not models.ReleaseSignoff.objects.filter(
+            id=signoff.id, signed=False).update(signed=True):
+        return False
+
+    signoff.signed = True
+    release = signoff.release
+
+    if not release.waiting:
+        return False
+
+    try:
+        signed, required = signedCount(release, signoff)
+    except redis.RedisError:
+        signed = models.ReleaseSignoff.objects.filter(
+            release=release, signed=True).count()
+        required = requiredSignoffs(release)
+
+    if signed < required:
+        return False
+
+    if not models.Release.objects.filter(
+            id=release.id, waiting=True).update(waiting=False):
+        return False
+
+    release.waiting = False
+    try:
+        tasks.runRelease(release)
+    except Exception:
+        unsign(signoff)
+        raise
+
+    return True
+
+def unsign(signoff):
+    """Undoes sign() after the release failed to fire"""
+    release = signoff.release
+
+    models.Release.objects.filter(id=release.id).update(waiting=True)
+    models.ReleaseSignoff.objects.filter(id=signoff.id).update(signed=False)
+    release.waiting = True
+    signoff.signed = False
+
+    try:
+        getRedis().srem(signedKey(release.id), signoff.id)
+    except redis.RedisError:
+        pass
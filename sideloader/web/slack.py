@@ -1,9 +1,231 @@
 # -*- coding: utf-8 -*-
 # Slack client library
 
+import atexit
+import collections
 import httplib
 import urllib
 import json
+import socket
+import threading
+import time
+import Queue
+
+
+# How long exiting processes wait for queued messages to go out
+FLUSH_TIMEOUT = 10
+
+def payload(channel, attachments):
+    return urllib.urlencode({
+        'payload': json.dumps({
+            'channel': channel,
+            'username': 'sideloader',
+            'icon_emoji': ':greenrocket:',
+            'attachments': attachments
+        })
+    })
+
+
+class SlackQueue(object):
+    """Delivers Slack webhook messages from a background thread.
+
+    Messages for the same channel that arrive within window seconds of
+    each other are coalesced into a single post with one attachment per
+    message. A full queue drops new messages rather than blocking."""
+    def __init__(self, host, token, window=2, maxsize=1000,
+                 max_attachments=20, retries=5, timeout=10):
+        self.host = host
+        self.token = token
+        self.window = window
+        self.max_attachments = max_attachments
+        self.retries = retries
+        self.timeout = timeout
+
+        self.queue = Queue.Queue(maxsize)
+        self.conn = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.posts = 0
+        self.last_latency = 0
+        self.max_latency = 0
+        self.total_latency = 0
+
+    def put(self, channel, attachment):
+        """Queues a message, returns False if it was dropped"""
+        try:
+            self.queue.put_nowait((time.time(), channel, attachment))
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        self.start()
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Waits up to timeout seconds for queued messages to be delivered
+        or given up on. Returns False if some are still pending"""
+        deadline = time.time() + timeout
+
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                'depth': self.queue.qsize(),
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'posts': self.posts,
+                'last_latency': self.last_latency,
+                'max_latency': self.max_latency,
+                'avg_latency': (self.total_latency / self.sent
+                    if self.sent else 0)
+            }
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.window
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Queue.Empty:
+                break
+
+        channels = collections.OrderedDict()
+        for item in batch:
+            channels.setdefault(item[1], []).append(item)
+
+        return channels
+
+    def run(self):
+        while True:
+            for channel, items in self.collect().items():
+                for i in range(0, len(items), self.max_attachments):
+                    batch = items[i:i + self.max_attachments]
+                    try:
+                        self.deliver(channel, batch)
+                    except Exception:
+                        with self.lock:
+                            self.failed += len(batch)
+                    finally:
+                        for item in batch:
+                            self.queue.task_done()
+
+    def post(self, params):
+        if self.conn is None:
+            self.conn = httplib.HTTPSConnection(self.host, 443,
+                timeout=self.timeout)
+
+        try:
+            self.conn.request("POST",
+                "/services/hooks/incoming-webhook?token=%s" % self.token,
+                params, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+            res = self.conn.getresponse()
+            res.read()
+        except (httplib.HTTPException, socket.error):
+            self.conn.close()
+            self.conn = None
+            raise
+
+        if res.will_close:
+            self.conn.close()
+            self.conn = None
+
+        return res
+
+    def deliver(self, channel, items):
+        params = payload(channel, [item[2] for item in items])
+
+        for attempt in range(self.retries):
+            try:
+                res = self.post(params)
+            except (httplib.HTTPException, socket.error):
+                time.sleep(2 ** attempt)
+                continue
+
+            if res.status == 429:
+                # Rate limited, wait as long as Slack asks us to
+                retry = res.getheader('retry-after')
+                time.sleep(int(retry) if retry and retry.isdigit()
+                    else 2 ** attempt)
+                continue
+
+            if res.status >= 500:
+                time.sleep(2 ** attempt)
+                continue
+
+            if res.status >= 400:
+                # Slack refused the message, sending it again won't help
+                with self.lock:
+                    self.failed += len(items)
+                return
+
+            break
+        else:
+            with self.lock:
+                self.failed += len(items)
+            return
+
+        now = time.time()
+        with self.lock:
+            self.posts += 1
+            for item in items:
+                latency = now - item[0]
+                self.sent += 1
+                self.total_latency += latency
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+
+_queues = {}
+_queuesLock = threading.Lock()
+
+def getQueue(host, token):
+    with _queuesLock:
+        if (host, token) not in _queues:
+            _queues[(host, token)] = SlackQueue(host, token)
+
+        return _queues[(host, token)]
+
+@atexit.register
+def flushQueues():
+    # The senders are daemon threads, give them a chance to finish
+    # before a short lived process exits
+    deadline = time.time() + FLUSH_TIMEOUT
+    for q in _queues.values():
+        q.flush(max(deadline - time.time(), 0))
+
+def queueStats():
+    stats = []
+    for (host, token), q in _queues.items():
+        s = q.stats()
+        s['host'] = host
+        stats.append(s)
+
+    return stats
 
 
 class SlackClient(object):
@@ -12,27 +234,26 @@ class SlackClient(object):
         self.token = token
         self.channel = channel
 
-    def message(self, text, fields=[]):
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        conn = httplib.HTTPSConnection(self.host, 443)
+    def message(self, text, fields=[], wait=False):
+        """Queue a message for delivery, this never blocks on Slack and
+        returns False if the queue was full. With wait the message is
+        posted right away and the HTTP response is returned"""
+        attachment = {
+            'fallback': text,
+            'pretext': text,
+            'color': '#0000D0',
+            'fields': fields
+        }
 
-        params = urllib.urlencode({
-            'payload': json.dumps({
-                'channel': self.channel,
-                'username': 'sideloader',
-                'icon_emoji': ':greenrocket:',
-                'attachments':[{
-                    'fallback': text,
-                    'pretext': text,
-                    'color': '#0000D0',
-                    'fields': fields
-                }]
-            })
-        })
+        if not wait:
+            return getQueue(self.host, self.token).put(self.channel,
+                attachment)
 
-        conn.request("POST", 
+        conn = httplib.HTTPSConnection(self.host, 443)
+        conn.request("POST",
             "/services/hooks/incoming-webhook?token=%s" % self.token,
-            params, headers)
+            payload(self.channel, [attachment]),
+            {'Content-Type': 'application/x-www-form-urlencoded'})
 
         res = conn.getresponse()
         conn.close()
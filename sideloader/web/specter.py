@@ -6,14 +6,90 @@ import base64
 import hmac
 import httplib
 import json
+import socket
+import threading
+import time
+import Queue
+
+
+class ConnectionPool(object):
+    """Idle keep-alive HTTPS connections to one host, shared by threads.
+    At most size connections are kept, more are opened when busy"""
+    def __init__(self, host, port, size=4, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue(size)
+
+    def get(self, fresh=False):
+        """Returns a connection and whether it was reused from the pool.
+        fresh always opens a new one"""
+        if not fresh:
+            try:
+                return self.idle.get_nowait(), True
+            except Queue.Empty:
+                pass
+
+        return httplib.HTTPSConnection(self.host, self.port,
+            timeout=self.timeout), False
+
+    def put(self, conn):
+        try:
+            self.idle.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+def getPool(host, port, size=4, timeout=30):
+    """Clients with the same pool size and timeout share one pool per
+    host and port"""
+    key = (host, port, size, timeout)
+
+    with _poolsLock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(host, port, size, timeout)
+
+        return _pools[key]
+
+
+# Methods that can be sent again after the server may have seen them
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
+
+
+class SpecterError(Exception):
+    def __init__(self, status, body):
+        Exception.__init__(self, 'HTTP %s: %s' % (status, body))
+        self.status = status
+        self.body = body
+
+
+class BatchResult(object):
+    def __init__(self, path, result=None, error=None, host=None):
+        self.path = path
+        self.result = result
+        self.error = error
+        self.host = host
 
 
 class SpecterClient(object):
-    def __init__(self, host, auth, key, port=2400):
+    def __init__(self, host, auth, key, port=2400, pool_size=4, timeout=30,
+                 retries=2, backoff=0.5):
         self.host = host
         self.port = port
         self.auth = auth
         self.key = key
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = getPool(host, port, pool_size, timeout)
 
     def createSignature(self, path, data=None):
         if data:
@@ -31,19 +107,54 @@ class SpecterClient(object):
 
         return base64.b64encode(mysig)
 
-    def httpsRequest(self, path, headers={}, method='GET', data=None):
-        headers['Content-Type'] = ['application/json']
-        conn = httplib.HTTPSConnection(self.host, self.port)
+    def send(self, path, headers=None, method='GET', data=None):
+        """Returns the status and body of the reply"""
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
 
-        if data:
-            conn.request(method, '/'+path, data, headers)
-        else:
-            conn.request(method, '/'+path, None, headers)
-                
-        response = conn.getresponse()
+        # Only these are retried, the server may have acted on anything
+        # else even if the reply was lost
+        idempotent = method in IDEMPOTENT
+
+        failures = 0
+        while True:
+            # A server that closed an idle connection is only noticed once
+            # the request is written, so other requests get a new one
+            conn, reused = self.pool.get(fresh=not idempotent)
 
-        if response.status == 200:
-            return json.loads(response.read())
+            try:
+                conn.request(method, '/'+path, data, headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+
+                if not idempotent:
+                    raise
+
+                if reused and not isinstance(e, socket.timeout):
+                    # The server dropped an idle connection, try a new one
+                    continue
+
+                failures += 1
+                if failures > self.retries:
+                    raise
+
+                time.sleep(self.backoff * failures)
+                continue
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.put(conn)
+
+            return response.status, body
+
+    def httpsRequest(self, path, headers=None, method='GET', data=None):
+        status, body = self.send(path, headers, method, data)
+
+        if status == 200:
+            return json.loads(body)
         else:
             return None
 
@@ -72,6 +183,25 @@ class SpecterClient(object):
             data=data
         )
 
+    def call(self, path, data=None):
+        """GETs path, or POSTs data JSON encoded if it isn't None. Raises
+        SpecterError unless the agent replies 200"""
+        if data is None:
+            headers, method = self.signHeaders(path), 'GET'
+        else:
+            data = json.dumps(data)
+            headers, method = self.signHeaders(path, data), 'POST'
+
+        status, body = self.send(path, headers, method, data)
+        if status != 200:
+            raise SpecterError(status, body)
+
+        return json.loads(body)
+
+    def batch(self, calls, workers=8):
+        """Runs a list of (path, data) calls on this agent, see batch()"""
+        return batch([(self, path, data) for path, data in calls], workers)
+
     def __getattr__(self, method):
         if method[:4] == 'get_':
             path = '/'.join(method[4:].split('_'))
@@ -84,3 +214,39 @@ class SpecterClient(object):
         else:
             raise AttributeError
 
+
+def batch(calls, workers=8):
+    """Run a list of (client, path, data) calls concurrently on up to
+    workers threads. The clients can be for different agents. Calls with
+    data of None are GETs, anything else is JSON encoded and POSTed.
+    Returns a BatchResult for each call, in the same order, with error
+    set if that call raised or the agent did not reply 200"""
+    results = [None] * len(calls)
+    work = Queue.Queue()
+
+    for i, call in enumerate(calls):
+        work.put((i, call))
+
+    def worker():
+        while True:
+            try:
+                i, (client, path, data) = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                results[i] = BatchResult(path, result=client.call(path, data),
+                    host=client.host)
+            except Exception, e:
+                results[i] = BatchResult(path, error=e, host=client.host)
+
+    threads = [threading.Thread(target=worker)
+        for i in range(min(workers, len(calls)))]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    return results
@@ -1,14 +1,31 @@
 from rhumba.client import RhumbaClient
 
-def build(build):
+from sideloader.web import rollout
+
+def build(build, branch=None):
     c = RhumbaClient()
 
-    print build
+    params = {'build_id': build.id}
+    if branch:
+        params['branch'] = branch
+
+    return c.queue('sideloader', 'build', params)
+
+def pushRelease(build_id, flow):
+    """Returns the rollout id if the stream deploys to servers"""
+    servers = rollout.serverTargets(flow)
+    if servers:
+        return rollout.startRollout(build_id, flow, servers)
 
-    return c.queue('sideloader', 'build', {})
+    RhumbaClient().queue('sideloader', 'release', {
+        'build_id': build_id,
+        'flow_id': flow.id
+    })
 
-def pushRelease(build_id, flow, scheduled=None):
-    pass
+def runRelease(release):
+    return RhumbaClient().queue('sideloader', 'release', {
+        'release_id': release.id
+    })
 
 def getClusterStatus():
     return RhumbaClient().clusterStatus()
@@ -19,9 +19,14 @@ urlpatterns = patterns('',
     url(r'^projects/delete/(?P<id>[\d]+)$', project.ProjectDelete.as_view(), name='projects_delete'),
     url(r'^projects/server/request/(?P<project>[\d]+)$', project.ServerRequest.as_view(), name='server_request'),
     url(r'^projects/graph/(?P<id>[\d]+)$', project.ProjectGraph.as_view(), name='project_graph'),
+    url(r'^projects/artifacts/(?P<id>[\d]+)$', project.ProjectArtifacts.as_view(), name='project_artifacts'),
 
+    url(r'^projects/builds/$', project.BuildHistoryView.as_view(), name='build_history'),
+    url(r'^projects/builds/json$', project.BuildHistory.as_view(), name='build_history_json'),
+    url(r'^projects/builds/queue$', project.BuildQueue.as_view(), name='build_queue'),
     url(r'^projects/build/view/(?P<id>[\d]+)$', project.BuildView.as_view(), name='build_view'),
     url(r'^projects/build/log/(?P<id>[\d]+)$', project.BuildOutput.as_view(), name='build_output'),
+    url(r'^projects/build/wait/(?P<id>[\d]+)$', project.BuildWait.as_view(), name='build_wait'),
     url(r'^projects/build/cancel/(?P<id>[\d]+)$', project.BuildCancel.as_view(), name='build_cancel'),
 
     # Repos
@@ -37,6 +42,8 @@ urlpatterns = patterns('',
     url(r'^stream/suck/(?P<id>[\d]+)$', project.ReleaseDelete.as_view(), name='release_delete'),
     url(r'^stream/push/(?P<flow>[\d]+)/(?P<build>[\d]+)$', project.StreamPush.as_view(), name='stream_push'),
     url(r'^stream/schedule/(?P<flow>[\d]+)/(?P<build>[\w-]+)$', project.StreamSchedule.as_view(), name='stream_schedule'),
+    url(r'^stream/rollout/(?P<id>[\w]+)$', project.RolloutStatus.as_view(), name='rollout_status'),
+    url(r'^stream/rollout/(?P<flow>[\d]+)/(?P<build>[\d]+)$', project.StreamRollout.as_view(), name='stream_rollout'),
     url(r'^stream/build/(?P<id>[\d]+)$', project.ProjectBuild.as_view(), name='stream_build'),
 
     # Targets
@@ -50,6 +57,8 @@ urlpatterns = patterns('',
     #url(r'^releases/$', 'sideloader.web.views.project.release_index', name='release_index'),
 
     # Servers
+    url(r'^servers/fleet$', project.FleetView.as_view(), name='fleet_view'),
+    url(r'^servers/fleet/json$', project.FleetStatus.as_view(), name='fleet_status'),
     #url(r'^servers/$', 'sideloader.web.views.project.server_index', name='server_index'),
     #url(r'^servers/log/(?P<id>[\d]+)$', 'sideloader.web.views.project.server_log', name='server_log'),
     #url(r'^servers/json/$', 'sideloader.web.views.project.get_servers', name='get_servers'),
@@ -60,15 +69,22 @@ urlpatterns = patterns('',
 
     # Admin
     url(r'^manage/$', 'sideloader.web.views.admin.manage_index', name='manage_index'),
+    url(r'^manage/cluster$', 'sideloader.web.views.admin.manage_cluster', name='manage_cluster'),
+    url(r'^manage/webhooks$', 'sideloader.web.views.admin.manage_webhooks', name='manage_webhooks'),
     url(r'^manage/repo/create$', 'sideloader.web.views.admin.manage_create_repo', name='manage_create_repo'),
     url(r'^manage/repo/delete/(?P<id>[\d+])$', 'sideloader.web.views.admin.manage_delete_repo', name='manage_delete_repo'),
+    url(r'^manage/repo/reindex/(?P<id>[\d]+)$', 'sideloader.web.views.admin.manage_reindex_repo', name='manage_reindex_repo'),
 
     # API
     url(r'^api/build/(?P<hash>[\w]+)$', 'sideloader.web.views.api.api_build', name='api_build'),
     url(r'^api/rap/(?P<hash>[\w]+)$', 'sideloader.web.views.api.api_sign', name='api_sign'),
     url(r'^api/checkin$', 'sideloader.web.views.api.api_checkin', name='api_checkin'),
+    url(r'^api/heartbeat/(?P<task_id>[\w-]+)$', 'sideloader.web.views.api.api_heartbeat', name='api_heartbeat'),
     url(r'^api/enc/(?P<server>[\w.-]+)$', 'sideloader.web.views.api.api_enc', name='api_enc'),
 
+    # Packages, normally served straight from SIDELOADER_PACKAGE_ROOT
+    url(r'^packages/(?P<path>.+)$', 'sideloader.web.views.api.api_package', name='api_package'),
+
     # Authentication
     url(r'^accounts/login/$', 'django.contrib.auth.views.login', {'template_name': 'login.html'}),
     url(r'^accounts/logout/$', 'django.contrib.auth.views.logout', {'next_page': '/'}, name='auth_logout'),
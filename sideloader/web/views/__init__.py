@@ -12,12 +12,15 @@ from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, Http404
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.conf import settings
+from django.core.cache import cache
 
 from django.views.generic.base import TemplateView, RedirectView, View
 from django.views.generic.edit import FormView
 
 from sideloader.web import forms, tasks
+from sideloader.web.permissions import projectsCacheKey
 
 from sideloader.db import models
 
@@ -28,9 +31,25 @@ class PageMixin(object):
         view = super(PageMixin, cls).as_view(**initkwargs)
         return login_required(view)
 
+    def getAllowedProjectIds(self):
+        """Set of project ids the user is a member of. Kept for the
+        request, and in the cache until the user's membership changes"""
+        if not hasattr(self, '_allowed_project_ids'):
+            key = projectsCacheKey(self.request.user.id)
+            ids = cache.get(key)
+
+            if ids is None:
+                ids = set(self.request.user.project_set.values_list(
+                    'id', flat=True))
+                cache.set(key, ids, settings.SIDELOADER_PERMISSION_CACHE_TTL)
+
+            self._allowed_project_ids = ids
+
+        return self._allowed_project_ids
+
     def hasProjectPermission(self, project):
-        return (self.request.user.is_superuser) or (
-            project in self.request.user.project_set.all())
+        return (self.request.user.is_superuser) or (project is not None and
+            project.id in self.getAllowedProjectIds())
 
     def getObjectIfAllowed(self, model, **kwargs):
         obj = get_object_or_404(model, pk=kwargs['id'])
@@ -57,7 +76,19 @@ class PageMixin(object):
         if self.request.user.is_superuser:
             return models.Project.objects.all().order_by('name')
         else:
-            return self.request.user.project_set.all().order_by('name')
+            return models.Project.objects.filter(
+                id__in=self.getAllowedProjectIds()).order_by('name')
+
+    def getPage(self, queryset, param, per_page):
+        """Returns the page of queryset selected by the request's param"""
+        paginator = Paginator(queryset, per_page)
+
+        try:
+            return paginator.page(self.request.GET.get(param, 1))
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
 
     def renderData(self):
         pass
@@ -3,7 +3,6 @@ import uuid
 import urlparse
 import json
 import hashlib, hmac, base64
-import time
 import yaml
 
 from django.shortcuts import render, redirect
@@ -16,7 +15,7 @@ from django.conf import settings
 
 from django.views.generic.base import TemplateView
 
-from sideloader.web import forms, tasks
+from sideloader.web import forms, cluster, repoindex, webhooks
 from sideloader.db import models
 
 
@@ -46,22 +45,29 @@ def manage_index(request):
     users = User.objects.all().order_by('username')
     repos = models.PackageRepo.objects.all().order_by('name')
 
-    hives = []
-    for k, v in tasks.getClusterStatus().items():
-        v['hostname'] = k
-        hives.append({
-            'hostname': k,
-            'lastseen': time.ctime(v['lastseen']),
-            'status': v['status']
-        })
-
     return render(request, "manage/index.html", {
         'projects': getProjects(request),
         'users': users,
         'repos': repos,
-        'hives': hives
+        'cluster': cluster.getStatus()
     })
 
+@login_required
+def manage_cluster(request):
+    if not request.user.is_superuser:
+        return redirect('home')
+
+    return HttpResponse(json.dumps(cluster.getStatus()),
+        content_type='application/json')
+
+@login_required
+def manage_webhooks(request):
+    if not request.user.is_superuser:
+        return redirect('home')
+
+    return HttpResponse(json.dumps(webhooks.deliveryStats()),
+        content_type='application/json')
+
 @login_required
 def manage_create_repo(request):
     if not request.user.is_superuser:
@@ -82,6 +88,17 @@ def manage_create_repo(request):
         'projects': getProjects(request),
     })
 
+@login_required
+def manage_reindex_repo(request, id):
+    if not request.user.is_superuser:
+        return redirect('home')
+
+    if request.method == "POST":
+        repo = models.PackageRepo.objects.get(id=id)
+        repoindex.queueRebuild(repo.name)
+
+    return redirect('manage_index')
+
 @login_required
 def manage_delete_repo(request, id):
     repo = models.PackageRepo.objects.get(id=id)
@@ -3,59 +3,126 @@ import uuid
 import urlparse
 import json
 import hashlib, hmac, base64
+import mimetypes
+import os
+import re
 import time
 import yaml
 
+import redis
+
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404
+from django.http import (HttpResponse, HttpResponseNotModified, Http404,
+    FileResponse, StreamingHttpResponse)
 
 from django.conf import settings
 
-from sideloader.web import forms, tasks
+from sideloader.web import (forms, tasks, enc, buildqueue, signoffs,
+    checkins, packages, webhooks, routing, heartbeats)
 from sideloader.db import models
 
+BUILD_RESULTS = {
+    'ignored': 'Request ignored',
+    'building': 'Building',
+    'duplicate': 'Duplicate delivery',
+    'queued': 'Already queued',
+    'running': 'Already building',
+}
+
+def verifyHMAC(request, data=None):
+    clientauth = request.META.get('HTTP_AUTHORIZATION')
+    sig = request.META.get('HTTP_SIG')
+
+    if clientauth != settings.SPECTER_AUTHCODE:
+        return False
+
+    sign = [settings.SPECTER_AUTHCODE, request.method, request.path]
+
+    if data:
+        sign.append(
+            hashlib.sha1(data).hexdigest()
+        )
+
+    mysig = hmac.new(
+        key = settings.SPECTER_SECRET,
+        msg = '\n'.join(sign),
+        digestmod = hashlib.sha1
+    ).digest()
+
+    return base64.b64encode(mysig) == sig
+
 @csrf_exempt
 def api_build(request, hash):
-    project = models.Project.objects.get(idhash=hash)
-    if project:
-        if request.method == 'POST':
-            if request.POST.get('payload'):
-                r = json.loads(request.POST['payload'])
-            else:
-                r = json.loads(request.body)
-            ref = r.get('ref', '')
-            branch = ref.split('/',2)[-1]
-            if branch != project.branch:
-                return HttpResponse('{"result": "Request ignored"}',
-                        content_type='application/json')
-
-        current_builds = models.Build.objects.filter(project=project, state=0)
-        if not current_builds:
-            build = models.Build.objects.create(project=project, state=0)
-            task = tasks.build(build)
-            build.task_id = task.task_id
-            build.save()
-
-            return HttpResponse('{"result": "Building"}',
-                    content_type='application/json')
-        return HttpResponse('{"result": "Already building"}',
+    started = time.time()
+    delivery = request.META.get('HTTP_X_GITHUB_DELIVERY')
+
+    hook = webhooks.getHook(hash)
+    if hook is None:
+        return HttpResponse('{"result": "Not found"}', status=404,
                 content_type='application/json')
 
-    return redirect('home')
+    project_id, branch = hook
+    routes = routing.getRoutes(project_id)
+    repos = {}
+
+    if request.method == 'POST':
+        # Form encoded deliveries carry the JSON in a payload field
+        payload = request.POST.get('payload') or request.body
+        try:
+            pushed = webhooks.pushedBranch(payload)
+
+            # Only a branch some stream builds is worth decoding the rest
+            # of the payload for
+            if pushed in routing.routedBranches(routes):
+                data = json.loads(payload)
+                if not isinstance(data, dict):
+                    raise ValueError('Payload is not an object')
+
+                repos = routing.resolvePush(routes, data.get('repository'),
+                    pushed)
+        except ValueError:
+            return HttpResponse('{"result": "Bad payload"}', status=400,
+                    content_type='application/json')
+    else:
+        pushed = branch
+
+    streams = []
+
+    if repos:
+        # One build per repo, whatever number of its streams follow the
+        # branch
+        project = models.Project.objects.get(id=project_id)
+        results = []
+        for repo_id in sorted(repos):
+            results.append(buildqueue.admitBuild(project, branch=pushed,
+                delivery=delivery and '%s.%s' % (delivery, repo_id),
+                repo_id=repo_id)[0])
+            streams.extend(repos[repo_id])
+
+        result = 'building' if 'building' in results else results[0]
+    elif pushed == branch:
+        project = models.Project.objects.get(id=project_id)
+        result, build = buildqueue.admitBuild(project, delivery=delivery)
+    else:
+        result = 'ignored'
+
+    webhooks.recordDelivery(delivery, project_id, result, started)
+
+    return HttpResponse(json.dumps({
+        'result': BUILD_RESULTS[result],
+        'streams': sorted(streams)
+    }), content_type='application/json')
 
 @csrf_exempt
 def api_sign(request, hash):
-    signoff = models.ReleaseSignoff.objects.get(idhash=hash)
-    signoff.signed = True
-    signoff.save()
+    signoff = models.ReleaseSignoff.objects.select_related(
+        'release__stream').get(idhash=hash)
 
-    if signoff.release.waiting:
-        if signoff.release.check_signoff():
-            tasks.runRelease.delay(signoff.release)
+    signoffs.sign(signoff)
 
     return render(request, "sign.html", {
         'signoff': signoff
@@ -66,16 +133,28 @@ def api_checkin(request):
     # Server checkin endpoint
     if request.method == 'POST':
         if verifyHMAC(request, request.body):
-            data = json.loads(request.body)
             try:
-                server = models.Server.objects.get(name=data['hostname'])
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+
+            if not isinstance(data, dict):
+                return HttpResponse(
+                    json.dumps({"error": "Bad payload"}), status=400,
+                    content_type='application/json')
 
-            except models.Server.DoesNotExist:
-                server = models.Server.objects.create(name=data['hostname'])
+            # Relays report many hosts at once
+            hostnames = data.get('hostnames', [])
+            if data.get('hostname') and isinstance(hostnames, list):
+                hostnames.append(data['hostname'])
 
-            server.last_checkin = datetime.now()
+            if not (isinstance(hostnames, list) and all(
+                    isinstance(h, basestring) for h in hostnames)):
+                return HttpResponse(
+                    json.dumps({"error": "Invalid hostnames"}), status=400,
+                    content_type='application/json')
 
-            server.save()
+            checkins.recordCheckins(hostnames)
 
             return HttpResponse(json.dumps({}), 
                 content_type='application/json')
@@ -85,65 +164,166 @@ def api_checkin(request):
             content_type='application/json'
         )
 
+@csrf_exempt
+def api_heartbeat(request, task_id):
+    # Build workers report that the build running as task_id is alive
+    if request.method == 'POST' and verifyHMAC(request, request.body):
+        if not buildqueue.runningBuilds().filter(task_id=task_id).exists():
+            return HttpResponse(
+                json.dumps({"error": "Not running"}), status=404,
+                content_type='application/json')
+
+        try:
+            heartbeats.beat(task_id)
+        except redis.RedisError:
+            return HttpResponse(
+                json.dumps({"error": "Heartbeats unavailable"}), status=503,
+                content_type='application/json')
+
+        return HttpResponse(json.dumps({}),
+            content_type='application/json')
+
+    return HttpResponse(
+            json.dumps({"error": "Not authorized"}), 
+            content_type='application/json'
+        )
+
 @csrf_exempt
 def api_enc(request, server):
     # Puppet ENC
     if verifyHMAC(request):
-        # Build our ENC dict
-        try:
-            server = models.Server.objects.get(name=server)
-        except:
-            server = None
-
-        if server:
-            releases = [target.release for target in server.target_set.all()]
-            server.last_checkin = datetime.now()
-            server.last_puppet_run = datetime.now()
-            server.change = False
-            server.status = "Success"
-
-            cdict = {}
-            for release in releases:
-                for manifest in release.servermanifest_set.all():
-                    key = manifest.module.key
-                    try:
-                        value = json.loads(manifest.value)
-                    except Exception, e:
-                        server.status = "Validation error in manifest "
-                        server.status += "%s -> %s -> %s: %s" % (
-                            release.project.name,
-                            release.name,
-                            manifest.module.name,
-                            e
-                        )
-                        continue 
-
-                    if isinstance(value, list):
-                        if key in cdict:
-                            cdict[key].extend(value)
-                        else:
-                            cdict[key] = value
-
-                    if isinstance(value, dict):
-                        for k, v in value.items():
-                            if key in cdict:
-                                cdict[key][k] = v
-                            else:
-                                cdict[key] = {k: v}
-
-            server.save()
-
-            node = {
-                'parameters': cdict
-            }
+        node = enc.getNode(server)
+
+        if node:
+            now = datetime.now()
+            models.Server.objects.filter(name=server).update(
+                last_checkin=now,
+                last_puppet_run=now,
+                change=False,
+                status=node['status']
+            )
+            body, etag = node['yaml'], node['etag']
+        else:
+            body = yaml.safe_dump({})
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
         else:
-            node = {}
+            response = HttpResponse(body, content_type='application/yaml')
+
+        response['ETag'] = etag
 
-        return HttpResponse(yaml.safe_dump(node),
-            content_type='application/yaml')
+        return response
 
     return HttpResponse(
             json.dumps({"error": "Not authorized"}), 
             content_type='application/json'
         )
 
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def byteRange(header, size):
+    """Inclusive (start, end) of a single byte range, or None to send the
+    whole file. Raises ValueError if the range can't be satisfied"""
+    match = RANGE_RE.match(header or '')
+    if not match:
+        # Multiple ranges aren't supported, the whole file will do
+        return None
+
+    first, last = match.groups()
+    if first and last and int(first) > int(last):
+        # Invalid rather than unsatisfiable, so it is ignored
+        return None
+
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+
+    if start > end:
+        raise ValueError(header)
+
+    return start, end
+
+def readRange(f, start, length, block=65536):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(block, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+def api_package(request, path):
+    # Package downloads from the content addressed store
+    store = packages.getPackageStore()
+
+    try:
+        filename = store.namePath(path)
+    except ValueError:
+        raise Http404('Not found')
+
+    if not os.path.isfile(filename):
+        raise Http404('Not found')
+
+    # Published names link to blobs named by their digest
+    digest = store.digest(path)
+    etag = '"%s"' % digest if digest else None
+
+    if etag and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    content_type = (mimetypes.guess_type(filename)[0] or
+        'application/octet-stream')
+
+    sendfile = settings.SIDELOADER_PACKAGE_SENDFILE
+    if sendfile:
+        # The front end server sends the file itself, ranges included
+        response = HttpResponse(content_type=content_type)
+        if sendfile == 'X-Accel-Redirect':
+            # The root itself may be a symlink
+            response[sendfile] = (settings.SIDELOADER_PACKAGE_ACCEL_PREFIX +
+                os.path.relpath(os.path.realpath(filename),
+                    os.path.realpath(store.root)))
+        else:
+            response[sendfile] = os.path.realpath(filename)
+    else:
+        size = os.path.getsize(filename)
+
+        try:
+            requested = byteRange(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%s' % size
+            return response
+
+        f = open(filename, 'rb')
+
+        if requested:
+            start, end = requested
+            response = StreamingHttpResponse(
+                readRange(f, start, end - start + 1),
+                status=206, content_type=content_type)
+            response['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+            response['Content-Length'] = end - start + 1
+        else:
+            # Lets the WSGI server use sendfile
+            response = FileResponse(f, content_type=content_type)
+            response['Content-Length'] = size
+
+        response['Accept-Ranges'] = 'bytes'
+
+    if etag:
+        response['ETag'] = etag
+
+    return response
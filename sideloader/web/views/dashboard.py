@@ -1,3 +1,11 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from sideloader.web.dashboard import dashboardKey
 from sideloader.web.views import SideloaderView
 from sideloader.db import models
 
@@ -5,28 +13,46 @@ from sideloader.db import models
 class DashboardView(SideloaderView):
     template_name = "index.html"
 
-    def renderData(self):
+    def getCacheKey(self, project_ids):
+        # Users who can see the same projects share a cached dashboard
+        if self.request.user.is_superuser:
+            scope = 'admin'
+        else:
+            scope = hashlib.sha1(
+                ','.join(str(i) for i in sorted(project_ids))).hexdigest()
+
+        return dashboardKey(scope)
+
+    def getBuildData(self, project_ids):
+        last_builds = models.Build.objects.filter(state__gt=0).select_related(
+            'project').prefetch_related('project__releaseflow_set').order_by(
+            '-build_time')
+
         if self.request.user.is_superuser:
-            builds = models.Build.objects.filter(state=0).order_by('-build_time')
-            last_builds = models.Build.objects.filter(state__gt=0).order_by('-build_time')[:10]
+            last_builds = last_builds[:10]
 
             requests = models.ServerRequest.objects.filter(provisioned=False).order_by('request_date')
         else:
-            all_builds = models.Build.objects.filter(state=0).order_by('-build_time')
-            last_builds = models.Build.objects.filter(state__gt=0, project__in=self.projects).order_by('-build_time')[:10]
+            last_builds = last_builds.filter(project__in=project_ids)[:10]
 
             requests = []
 
-            builds = []
-            for build in all_builds:
-                if build.project in self.projects:
-                    builds.append(build)
-                else:
-                    builds.append({'build_time': build.build_time, 'project': {'name': 'Private'}})
-
         return {
-            'builds': builds,
             'last_builds': last_builds,
             'requests': requests,
+            'user': self.request.user,
         }
 
+    def renderData(self):
+        project_ids = self.getAllowedProjectIds()
+        key = self.getCacheKey(project_ids)
+
+        dashboard = cache.get(key)
+        if dashboard is None:
+            dashboard = render_to_string('fragments/dashboard.html',
+                self.getBuildData(project_ids), request=self.request)
+            cache.set(key, dashboard, settings.SIDELOADER_DASHBOARD_TTL)
+
+        return {
+            'dashboard': mark_safe(dashboard)
+        }
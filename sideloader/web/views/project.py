@@ -6,14 +6,22 @@ import hashlib, hmac, base64
 import time
 import yaml
 
+import redis
+
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, Http404
-
-from sideloader.web import forms, tasks
+from django.db.models import Q, F
+from django.db.models.functions import Length, Substr
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.conf import settings
+
+from sideloader.web import (forms, tasks, notify, buildqueue, releasequeue,
+    rollout, fleet, buildlog, artifacts)
 from sideloader.db import models
 from sideloader.web.views import (SideloaderView, SideloaderFormView,
     SideloaderDeleteView, SideloaderRedirectView, SideloaderJSONView)
@@ -28,31 +36,27 @@ class ProjectDeployView(SideloaderView):
 
         repos = project.repo_set.all().order_by('github_url')
 
-        builds = []
-        streams = []
-        releases = []
-
-        for repo in repos:
-            builds.extend(repo.build_set.all().order_by('-build_time'))
-            streams.extend(repo.stream_set.all().order_by('name'))
+        builds = models.Build.objects.filter(
+            repo__project=project
+        ).select_related('repo').order_by('-build_time', '-id')
 
-        for stream in streams:
-            releases.extend(stream.release_set.all().order_by(
-                '-release_date'))
+        streams = models.Stream.objects.filter(
+            repo__project=project
+        ).select_related('repo').order_by('name')
 
-        releases.sort(key=lambda r: r.release_date)
-
-        builds.sort(key=lambda r: r.build_time)
-
-        streams.sort(key=lambda r: r.name)
+        releases = models.Release.objects.filter(
+            stream__repo__project=project
+        ).select_related('stream', 'build').order_by('-release_date', '-id')
 
         return {
             'project': project,
             'repos': repos,
             'targets': project.target_set.all().order_by('description'),
-            'builds': reversed(builds),
+            'builds': self.getPage(builds, 'page',
+                settings.SIDELOADER_BUILDS_PER_PAGE),
             'streams': streams,
-            'releases': reversed(releases[-5:]),
+            'releases': self.getPage(releases, 'release_page',
+                settings.SIDELOADER_RELEASES_PER_PAGE),
         }
 
 class ProjectResourceView(SideloaderView):
@@ -204,9 +208,12 @@ class StreamPush(SideloaderRedirectView):
         flow = models.ReleaseStream.objects.get(id=self.flow)
         project = flow.project
         if self.hasProjectPermission(project):
-            tasks.pushRelease(self.build, flow)
-            
-        return redirect('projects_deploy_view', id=project.id)
+            rollout_id = tasks.pushRelease(self.build, flow)
+
+            if rollout_id:
+                return reverse('rollout_status', kwargs={'id': rollout_id})
+
+        return reverse('projects_deploy_view', kwargs={'id': project.id})
 
 class StreamSchedule(SideloaderFormView):
     flow = None
@@ -230,7 +237,7 @@ class StreamSchedule(SideloaderFormView):
 
         schedule = release['scheduled'] + timedelta(hours=int(release['tz']))
 
-        tasks.pushRelease(self.build, flow, scheduled=schedule)
+        releasequeue.scheduleRelease(self.build, flow, schedule)
         
         return redirect('projects_deploy_view', id=flow.project.id)
 
@@ -283,11 +290,13 @@ class BuildView(SideloaderView):
     id = None
 
     def renderData(self):
-        build = self.getObjectIfAllowed(models.Build, id=int(self.id))
+        build = self.getObjectIfAllowed(models.Build.objects.defer('log'),
+            id=int(self.id))
 
         return {
             'build': build,
-            'project': build.project
+            'project': build.project,
+            'log_tail': settings.SIDELOADER_LOG_TAIL
         }
             
 
@@ -376,30 +385,290 @@ class ProjectBuild(SideloaderRedirectView):
 
     def redirect(self):
         project = self.getProject(self.id)
+        bcount = project.build_counter + 1
+
+        result, build = buildqueue.admitBuild(project, followup=False,
+            build_num=bcount)
+
+        if result == 'building':
+            models.Project.objects.filter(id=project.id).update(
+                build_counter=F('build_counter') + 1)
 
-        current_builds = models.Build.objects.filter(project=project, state=0)
-        if current_builds:
-            return redirect('build_view', id=current_builds[0].id)
+        return reverse('build_view', kwargs={'id': build.id})
+
+class BuildOutput(SideloaderJSONView):
+    id = None
+
+    def getOffset(self):
+        try:
+            return max(int(self.request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return 0
+
+    def getTail(self):
+        try:
+            return max(int(self.request.GET['tail']), 0)
+        except (KeyError, ValueError):
+            return None
+
+    def getLogTail(self, offset, tail=None):
+        builds = models.Build.objects.defer('log')
+        build = self.getObjectIfAllowed(builds, id=self.id)
+
+        size = buildlog.logSize(build.id)
+        if size is None:
+            # Not moved to the chunk store yet. Offsets count characters
+            # of the log column and Postgres does the slicing.
+            size, log = builds.filter(id=build.id).annotate(
+                log_size=Length('log'),
+                log_tail=Substr('log', offset + 1)
+            ).values_list('log_size', 'log_tail')[0]
+            size = size or 0
         else:
-            build = models.Build.objects.create(project=project, state=0, build_num=bcount)
+            if tail is not None:
+                # Skip to the end of long logs
+                offset = max(offset, size - tail)
 
-            task_id = tasks.build(build)
+            log = buildlog.readLog(build.id, offset) if offset < size else ''
 
-            build.task_id = task_id
-            build.save()
+        if offset > size:
+            # The log was truncated or rewritten, send it from the start
+            data = self.getLogTail(0)
+            data['reset'] = True
+            return data
 
-            project.build_counter = bcount
-            project.save()
+        log = log or ''
 
-            return reverse('build_view', id=build.id)
+        # Text appended since size was read may already be in log
+        return {
+            'state': build.state,
+            'log': log,
+            'start': offset,
+            'offset': offset + len(log)
+        }
 
-        return reverse('home')
+    def getData(self):
+        return self.getLogTail(self.getOffset(), self.getTail())
 
-class BuildOutput(SideloaderJSONView):
+class BuildWait(BuildOutput):
+    """Long-poll version of BuildOutput. Holds the request until the log
+    grows past offset or the build leaves the state the client last saw"""
     id = None
+
     def getData(self):
-        build = self.getObjectIfAllowed(models.Build, id=self.id)
-        return {'state': build.state, 'log': build.log}
+        offset = self.getOffset()
+        tail = self.getTail()
+        state = self.request.GET.get('state')
+
+        deadline = time.time() + settings.SIDELOADER_LONGPOLL_TIMEOUT
+
+        # Subscribe before reading so a change between the read and the
+        # wait still wakes us up
+        subscription = notify.getNotifier().subscribe(
+            notify.buildChannel(self.id))
+
+        try:
+            while True:
+                data = self.getLogTail(offset, tail)
+
+                if (data['log'] or data.get('reset') or
+                    str(data['state']) != state or time.time() >= deadline):
+                    return data
+
+                subscription.wait(min(deadline - time.time(),
+                    settings.SIDELOADER_LONGPOLL_RECHECK))
+        finally:
+            subscription.close()
+
+class BuildHistoryView(SideloaderView):
+    template_name = 'projects/build_history.html'
+
+class BuildHistory(SideloaderJSONView):
+    """Keyset paginated build history, newest first. The cursor encodes
+    the build_time and id of the last build on the previous page, so
+    each page is an index range scan whatever the table size"""
+
+    def parseTime(self, value):
+        t = parse_datetime(value)
+        if t is None:
+            d = parse_date(value)
+            if d is None:
+                raise ValueError(value)
+            t = datetime.combine(d, datetime.min.time())
+
+        if timezone.is_naive(t):
+            t = timezone.make_aware(t, timezone.utc)
+
+        return t
+
+    def encodeCursor(self, build):
+        return base64.urlsafe_b64encode('%s|%s' % (
+            build.build_time.isoformat(), build.id))
+
+    def decodeCursor(self, cursor):
+        t, id = base64.urlsafe_b64decode(str(cursor)).split('|')
+        return self.parseTime(t), int(id)
+
+    def getData(self):
+        params = self.request.GET
+
+        builds = models.Build.objects.select_related('project').order_by(
+            '-build_time', '-id')
+
+        if not self.request.user.is_superuser:
+            builds = builds.filter(project__in=self.getProjects())
+
+        try:
+            for k in ('project', 'repo', 'state'):
+                if params.get(k):
+                    builds = builds.filter(**{k: int(params[k])})
+
+            if params.get('since'):
+                builds = builds.filter(
+                    build_time__gte=self.parseTime(params['since']))
+
+            if params.get('until'):
+                until = self.parseTime(params['until'])
+                if parse_date(params['until']):
+                    # A date on its own includes the whole of that day
+                    until += timedelta(days=1)
+                builds = builds.filter(build_time__lt=until)
+
+            if params.get('cursor'):
+                t, id = self.decodeCursor(params['cursor'])
+                builds = builds.filter(
+                    Q(build_time__lt=t) | Q(build_time=t, id__lt=id))
+
+            limit = min(max(int(params.get('limit', 50)), 1), 200)
+        except (ValueError, TypeError):
+            return {'error': 'Invalid query'}
+
+        # Fetch one extra row to know if there is another page
+        page = list(builds[:limit + 1])
+
+        if len(page) > limit:
+            page = page[:limit]
+            cursor = self.encodeCursor(page[-1])
+        else:
+            cursor = None
+
+        return {
+            'builds': [{
+                'id': build.id,
+                'project': build.project_id,
+                'project_name': build.project.name,
+                'repo': build.repo_id,
+                'build_num': build.build_num,
+                'state': build.state,
+                'build_time': build.build_time.isoformat(),
+            } for build in page],
+            'next': cursor
+        }
+
+class BuildQueue(SideloaderJSONView):
+    def getData(self):
+        try:
+            queue = buildqueue.queueStatus()
+        except redis.RedisError:
+            return {'error': 'Build queue unavailable'}
+
+        projects = dict(models.Project.objects.filter(
+            id__in=[e['project'] for e in queue]).values_list('id', 'name'))
+
+        allowed = self.getAllowedProjectIds()
+
+        data = []
+        for entry in queue:
+            if self.request.user.is_superuser or entry['project'] in allowed:
+                data.append({
+                    'build': entry['build'],
+                    'project_name': projects.get(entry['project']),
+                    'branch': entry['branch'],
+                    'priority': entry['priority'],
+                    'queued': entry['queued'],
+                    'eta': entry['eta']
+                })
+            else:
+                data.append({'project_name': 'Private', 'eta': entry['eta']})
+
+        return data
+
+class RolloutStatus(SideloaderJSONView):
+    id = None
+
+    def getData(self):
+        info = rollout.getRollout(self.id)
+
+        if info is None:
+            raise Http404('Not found')
+
+        self.getProject(info['project'])
+
+        progress = info['progress']
+        info['counts'] = dict((state, progress.count(state))
+            for state in set(progress))
+
+        return info
+
+class StreamRollout(SideloaderRedirectView):
+    """The last rollout of a build to a stream"""
+    flow = None
+    build = None
+
+    def redirect(self):
+        flow = models.ReleaseStream.objects.get(id=self.flow)
+        self.getProject(flow.project_id)
+
+        rollout_id = rollout.latestRollout(self.build, flow.id)
+        if rollout_id is None:
+            raise Http404('Not found')
+
+        return reverse('rollout_status', kwargs={'id': rollout_id})
+
+class FleetMixin(object):
+    def getFleetStatus(self):
+        try:
+            max_age = int(self.request.GET.get('age',
+                settings.SIDELOADER_STALE_CHECKIN))
+        except ValueError:
+            max_age = settings.SIDELOADER_STALE_CHECKIN
+
+        if self.request.user.is_superuser:
+            project_ids = None
+        else:
+            project_ids = self.getAllowedProjectIds()
+
+        return fleet.fleetStatus(max_age, project_ids)
+
+class FleetView(FleetMixin, SideloaderView):
+    template_name = 'servers/fleet.html'
+
+    def renderData(self):
+        return {'fleet': self.getFleetStatus()}
+
+class FleetStatus(FleetMixin, SideloaderJSONView):
+    def getData(self):
+        data = self.getFleetStatus()
+
+        for server in data['stale_servers']:
+            for k in ('last_checkin', 'last_puppet_run'):
+                if server[k]:
+                    server[k] = server[k].isoformat()
+
+        return data
+
+class ProjectArtifacts(SideloaderJSONView):
+    """Dependency cache hits and misses for a project's builds"""
+    id = None
+
+    def getData(self):
+        project = self.getProject(self.id)
+
+        stats = artifacts.getArtifactCache().stats(project.id)
+        if stats is None:
+            return {'error': 'Artifact stats unavailable'}
+
+        return stats
 
 class ServerList(SideloaderJSONView):
     def getData(self):
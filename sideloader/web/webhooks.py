@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Build webhook fast path
+#
+# api_build is hit for every push to every repo, most of which don't
+# lead to a build. The project a hook hash belongs to is cached, unknown
+# hashes included, and the pushed ref is read from the start of the
+# payload without parsing the rest of it where possible.
+
+import json
+import re
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+
+from sideloader.web.redisclient import getRedis
+from sideloader.db import models
+
+
+HISTORY_KEY = 'sideloader.webhooks'
+
+# GitHub sends ref as the first key of push payloads
+REF_RE = re.compile(r'^\s*\{\s*"ref"\s*:\s*"([^"\\]*)"')
+
+def hookKey(idhash):
+    return 'sideloader.hook.%s' % idhash
+
+def getHook(idhash):
+    """(project id, branch) for a hook hash, or None if there is no such
+    project"""
+    hook = cache.get(hookKey(idhash))
+
+    if hook is None:
+        project = models.Project.objects.filter(idhash=idhash).values_list(
+            'id', 'branch').first()
+
+        if project is None:
+            # Remember misses too, but not for as long
+            cache.set(hookKey(idhash), (), settings.SIDELOADER_HOOK_MISS_TTL)
+            return None
+
+        hook = tuple(project)
+        cache.set(hookKey(idhash), hook, settings.SIDELOADER_HOOK_CACHE_TTL)
+
+    return hook or None
+
+def invalidateHook(*idhashes):
+    cache.delete_many([hookKey(h) for h in idhashes if h])
+
+def pushedBranch(payload):
+    """The branch a push payload is for, or None if it has no ref"""
+    match = REF_RE.match(payload)
+    if match:
+        ref = match.group(1)
+    else:
+        data = json.loads(payload)
+        if not isinstance(data, dict):
+            raise ValueError('Payload is not an object')
+        ref = data.get('ref')
+
+    if ref is None:
+        return None
+
+    if not isinstance(ref, basestring):
+        raise ValueError('Bad ref %r' % (ref,))
+
+    return ref.split('/', 2)[-1]
+
+def recordDelivery(delivery, project_id, result, started):
+    """Keeps the latency of the last SIDELOADER_HOOK_HISTORY deliveries"""
+    entry = json.dumps({
+        'delivery': delivery,
+        'project': project_id,
+        'result': result,
+        'at': started,
+        'latency': time.time() - started
+    })
+
+    try:
+        pipe = getRedis().pipeline(transaction=False)
+        pipe.lpush(HISTORY_KEY, entry)
+        pipe.ltrim(HISTORY_KEY, 0, settings.SIDELOADER_HOOK_HISTORY - 1)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+def deliveryStats():
+    try:
+        history = getRedis().lrange(HISTORY_KEY, 0, -1)
+    except redis.RedisError:
+        history = []
+
+    deliveries = [json.loads(e) for e in history]
+    latencies = sorted(d['latency'] for d in deliveries)
+
+    def percentile(p):
+        if not latencies:
+            return 0
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    return {
+        'count': len(latencies),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'max': latencies[-1] if latencies else 0,
+        'recent': deliveries[:50]
+    }